@@ -7,28 +7,43 @@ Flask REST API that wraps the passport checking functionality
 import os
 import sys
 import json
-import time
+import base64
+import binascii
+import hashlib
+import itertools
 import logging
 import threading
-from datetime import datetime
-from flask import Flask, request, jsonify
+from datetime import datetime, timezone
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import undetected_chromedriver as uc
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from selenium.webdriver.common.by import By
-import random
-from bs4 import BeautifulSoup
 from logging.handlers import RotatingFileHandler
 
+from deadline import DEFAULT_CHECK_SECONDS
+from dispatcher import CheckDispatcher, QueueFull, QueueTimeout, INTERACTIVE, BATCH, SCHEDULED
+from passport_codes import normalize_code, validate_code
+
+# The check engine (undetected_chromedriver, selenium, bs4) is imported on
+# first use so the server answers /health without paying for it at startup.
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for mobile app
 
+# Streaming formats for /check-multiple and the media types that select them
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
 # Global variables
-driver = None
-driver_lock = threading.Lock()
+pool = None
+batch_engine = None
+store = None
+scheduler = None
+breaker = None
+dispatcher = None
+status_cache = None
+engine_lock = threading.Lock()
 config = {}
 
 def setup_logging():
@@ -91,322 +106,457 @@ def load_config():
         }
         return False
 
+def get_pool():
+    """Return the browser worker pool, creating it on first use"""
+    global pool
+    
+    with engine_lock:
+        if pool is None:
+            from worker_pool import BrowserWorkerPool
+            workers_config = config.get('workers', {})
+            pool = BrowserWorkerPool(
+                size=workers_config.get('count', 2),
+                task_timeout=workers_config.get('task_timeout', 180),
+                engine_options={
+                    'timeouts': config.get('timeouts', {}),
+                    'humanize': False,
+                    'rate_limit': config.get('rate_limit'),
+                    'page_load': config.get('page_load'),
+                    'artifacts': config.get('artifacts')
+                }
+            )
+        return pool
+
 def setup_driver():
-    """Setup Chrome driver with enhanced stability"""
-    global driver
+    """Start the browser workers ahead of the first request"""
+    try:
+        get_pool().start()
+        return True
+    except Exception as e:
+        logging.error(f"❌ Failed to start browser workers: {e}")
+        return False
+
+def get_batch_engine():
+    """Return the shared multi-tab CDP engine used for batch checks"""
+    global batch_engine
     
-    with driver_lock:
-        if driver is not None:
-            try:
-                driver.quit()
-            except:
-                pass
-        
-        logging.info("🔧 Setting up Chrome driver...")
-        
-        options = uc.ChromeOptions()
-        # Enhanced options for stability and Cloudflare bypass
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_argument('--window-size=1280,800')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--disable-infobars')
-        options.add_argument('--disable-browser-side-navigation')
-        options.add_argument('--disable-extensions')
-        options.add_argument('--disable-plugins')
-        options.add_argument('--lang=uk-UA,uk;q=0.9,en-US,en;q=0.8')
-        options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-          # Preferences to appear more human-like
-        prefs = {
-            "profile.default_content_setting_values.notifications": 2,
-            "credentials_enable_service": False,
-            "profile.password_manager_enabled": False,
-            "webrtc.ip_handling_policy": "disable_non_proxied_udp",
-            "profile.default_content_settings.popups": 0
+    with engine_lock:
+        if batch_engine is None:
+            from cdp_engine import BackgroundEngine
+            batch_config = config.get('batch', {})
+            batch_engine = BackgroundEngine(
+                timeouts=config.get('timeouts', {}),
+                max_tabs=batch_config.get('max_tabs', 3),
+                headless=batch_config.get('headless', False),
+                deadline_seconds=config.get('check_deadline_seconds', DEFAULT_CHECK_SECONDS),
+                page_load=config.get('page_load')
+            )
+        return batch_engine
+
+def to_status_dict(result):
+    """Convert a CheckResult into the API's status dict"""
+    return {
+        "status": result.status,
+        "message": result.message,
+        "success": result.success,
+        "details": {
+            "checkTime": result.checked_at,
+            "source": "passport.mfa.gov.ua",
+            "strategy": result.strategy,
+            "elapsed": result.elapsed,
+            "queueWait": result.queue_wait
         }
-        options.add_experimental_option("prefs", prefs)
-        # Remove problematic options that cause Chrome driver errors
-        # options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        # options.add_experimental_option('useAutomationExtension', False)
-        
-        try:
-            driver = uc.Chrome(options=options, version_main=None)
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            logging.info("✅ Chrome driver setup successful")
-            return True
-        except Exception as e:
-            logging.error(f"❌ Failed to setup Chrome driver: {e}")
-            driver = None
-            return False
-
-def wait_with_random_delay(min_seconds=2, max_seconds=5):
-    """Wait with random delay"""
-    delay = random.uniform(min_seconds, max_seconds)
-    time.sleep(delay)
-
-def find_element_safely(driver, selectors, timeout=10, element_type="element"):
-    """Safely find an element using multiple selectors"""
-    logging.info(f"🔍 Looking for {element_type}...")
-    
-    for i, selector in enumerate(selectors):
-        try:
-            if selector.startswith('//'):
-                # XPath selector
-                element = WebDriverWait(driver, timeout).until(
-                    EC.presence_of_element_located((By.XPATH, selector))
-                )
-            else:
-                # CSS selector
-                element = WebDriverWait(driver, timeout).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                )
-            
-            logging.info(f"✅ Found {element_type} with selector #{i+1}")
-            return element
-            
-        except TimeoutException:
-            logging.warning(f"⚠️ Selector #{i+1} failed for {element_type}: {selector}")
-            continue
-        except Exception as e:
-            logging.warning(f"⚠️ Unexpected error with selector #{i+1}: {e}")
-            continue
-    
-    logging.error(f"❌ Could not find {element_type} with any selector")
-    return None
+    }
 
-def check_passport_status(passport_code):
-    """Check passport status on the official website"""
-    global driver
-    
-    if not driver:
-        if not setup_driver():
-            return {
-                "status": "ERROR",
-                "message": "Failed to initialize browser",
-                "success": False
-            }
+def get_breaker():
+    """Return the circuit breaker guarding browser checks"""
+    global breaker
     
+    with engine_lock:
+        if breaker is None:
+            from circuit_breaker import CircuitBreaker
+            breaker = CircuitBreaker(**config.get('circuit_breaker', {}))
+        return breaker
+
+def run_check(passport_code):
+    """Run one check on the worker pool and return its CheckResult.
+
+    Raises CircuitOpen without touching the browser while the site is blocking us.
+    """
+    probe = get_breaker().before_check()
+    logging.info(f"🔍 Checking passport: {passport_code}")
+    deadline = config.get('check_deadline_seconds', DEFAULT_CHECK_SECONDS)
     try:
-        with driver_lock:
-            logging.info(f"🔍 Checking passport: {passport_code}")
-            
-            # Navigate to the passport website
-            url = "https://passport.mfa.gov.ua"
-            logging.info(f"🌐 Navigating to {url}")
-            driver.get(url)
-            
-            # Wait for page to load and handle Cloudflare if present
-            wait_with_random_delay(3, 7)
-            
-            # Check if Cloudflare challenge is present
-            try:
-                cf_elements = driver.find_elements(By.CSS_SELECTOR, '[data-ray], .cf-browser-verification, .cf-checking-browser, #cf-challenge-stage')
-                if cf_elements:
-                    logging.info("🛡️ Cloudflare protection detected, waiting...")
-                    time.sleep(10)  # Wait for Cloudflare to complete
-            except:
-                pass
-            
-            # Find input field for passport code
-            input_selectors = [
-                'input[type="text"]',
-                'input[placeholder*="сесії"]',
-                'input[placeholder*="session"]',
-                'input[id*="search"]',
-                'input[name*="search"]',
-                '.form-control',
-                '#sessionId',
-                '[data-testid="passport-input"]'
-            ]
-            
-            input_element = find_element_safely(
-                driver, 
-                input_selectors, 
-                timeout=config.get('timeouts', {}).get('search_input_wait', 10),
-                element_type="passport input field"
-            )
-            
-            if not input_element:
-                return {
-                    "status": "ERROR",
-                    "message": "Could not find passport input field on website",
-                    "success": False
-                }
-            
-            # Clear and enter passport code
-            logging.info(f"📝 Entering passport code: {passport_code}")
-            input_element.clear()
-            wait_with_random_delay(0.5, 1.5)
-            
-            # Type with human-like delays
-            for char in passport_code:
-                input_element.send_keys(char)
-                time.sleep(random.uniform(0.05, 0.15))
-            
-            wait_with_random_delay(1, 2)
-            
-            # Find and click search button
-            button_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:contains("пошук")',
-                'button:contains("Пошук")',
-                'button:contains("search")',
-                '.btn-primary',
-                '.search-btn',
-                '[data-testid="search-button"]'
-            ]
-            
-            search_button = find_element_safely(
-                driver, 
-                button_selectors, 
-                timeout=config.get('timeouts', {}).get('search_button_wait', 10),
-                element_type="search button"
+        result = get_pool().submit(passport_code, deadline=deadline)
+    except Exception:
+        get_breaker().cancel(probe)
+        raise
+    record_result(result, probe)
+    return result
+
+def record_result(result, probe=False):
+    """Feed a finished check to the circuit breaker and, if it succeeded, to the state store"""
+    get_breaker().record(result, probe)
+    if result.success:
+        get_store().save_result(result)
+
+def get_dispatcher():
+    """Return the bounded queue that admits checks to the worker pool"""
+    global dispatcher
+    
+    with engine_lock:
+        if dispatcher is None:
+            queue_config = config.get('queue', {})
+            dispatcher = CheckDispatcher(
+                run_check,
+                concurrency=config.get('workers', {}).get('count', 2),
+                max_depth=queue_config.get('max_depth', 20),
+                max_wait=queue_config.get('max_wait_seconds', 60),
+                lanes=queue_config.get('lanes')
             )
-            
-            if not search_button:
-                return {
-                    "status": "ERROR", 
-                    "message": "Could not find search button on website",
-                    "success": False
-                }
-            
-            # Click search button
-            logging.info("🔍 Clicking search button...")
-            search_button.click()
-            
-            # Wait for results
-            wait_with_random_delay(3, 6)
-            
-            # Extract results
-            return extract_passport_status(driver)
-            
-    except Exception as e:
-        logging.error(f"❌ Error checking passport {passport_code}: {e}")
+        return dispatcher
+
+def run_scheduled_check(passport_code):
+    """Queued check for background work: an open circuit counts as blocked, a full queue as an error"""
+    from circuit_breaker import CircuitOpen
+    from check_engine import CheckResult, BLOCKED, ERROR
+    try:
+        return get_dispatcher().submit(passport_code, lane=SCHEDULED)
+    except CircuitOpen as e:
+        return CheckResult(passport_code, BLOCKED, error=str(e))
+    except (QueueFull, QueueTimeout) as e:
+        return CheckResult(passport_code, ERROR, error=str(e))
+
+def stored_status_dict(cached, **details):
+    """Status dict for a row of the latest_results table"""
+    return {
+        "status": cached['status'],
+        "message": cached['text'],
+        "success": True,
+        "details": {
+            "checkTime": cached['checked_at'],
+            "source": "cache",
+            "strategy": cached['strategy'],
+            "cached": True,
+            "age": round(cached['age']),
+            **details
+        }
+    }
+
+def cached_status_dict(passport_code, retry_after):
+    """Status dict served while the circuit is open: the last known status if any"""
+    cached = get_store().latest_result(passport_code)
+    if not cached:
         return {
-            "status": "ERROR",
-            "message": f"Unexpected error: {str(e)}",
-            "success": False
+            "status": "BLOCKED",
+            "message": f"Site is blocking checks and no earlier status is known; retry in {retry_after:.0f}s",
+            "success": False,
+            "details": {"retryAfter": round(retry_after)}
         }
+    return stored_status_dict(cached, retryAfter=round(retry_after))
 
-def extract_passport_status(driver):
-    """Extract passport status from the page"""
+def invalid_code_dict(error):
+    """Status dict for a code rejected by pre-flight validation"""
+    return {
+        "status": "INVALID",
+        "message": error,
+        "success": False,
+        "details": {"source": "validation"}
+    }
+
+def negative_cache_hit(passport_code):
+    """Status dict if the site reported this code as not found within the negative cache TTL"""
+    ttl = config.get('negative_cache_ttl_seconds', 3600)
+    if ttl <= 0:
+        return None
+    cached = get_store().latest_result(passport_code)
+    if cached and cached['status'] == 'INVALID' and cached['age'] < ttl:
+        logging.info(f"🚫 {passport_code} was not found {cached['age']:.0f}s ago, answering from the negative cache")
+        return stored_status_dict(cached, negativeCache=True)
+    return None
+
+def get_status_cache():
+    """Return the stale-while-revalidate status cache, starting its refresh-ahead loop on first use"""
+    global status_cache
+    
+    state = get_store()
+    with engine_lock:
+        if status_cache is None:
+            from status_cache import StatusCache
+            cache_config = config.get('cache', {})
+            status_cache = StatusCache(
+                state,
+                refresh=run_scheduled_check,
+                ttl=cache_config.get('ttl_seconds', 600),
+                stale_ttl=cache_config.get('stale_seconds', 3600),
+                refresh_ahead=cache_config.get('refresh_ahead_seconds', 60),
+                hot_requests=cache_config.get('hot_requests', 3),
+                hot_window=cache_config.get('hot_window_seconds', 3600)
+            ).start()
+        return status_cache
+
+def cached_answer(passport_code):
+    """Status dict from the negative cache or the status cache, or None if a live check is needed"""
+    not_found = negative_cache_hit(passport_code)
+    if not_found:
+        return not_found
+    cached, state = get_status_cache().lookup(passport_code)
+    if cached:
+        from status_cache import STALE
+        return stored_status_dict(cached, stale=state == STALE)
+    return None
+
+def wants_fresh(data):
+    """True if the client asked to skip the caches ("fresh": true or Cache-Control: no-cache)"""
+    return bool(data.get('fresh')) or 'no-cache' in request.headers.get('Cache-Control', '')
+
+def check_passport_status(passport_code, lane=INTERACTIVE, fresh=False):
+    """Check passport status on the official website.
+
+    Unless fresh is set, a recently stored status is returned at once; a
+    stale one is refreshed in the background. Raises QueueFull or
+    QueueTimeout when the browsers are saturated.
+    """
+    from circuit_breaker import CircuitOpen
+    if not fresh:
+        answer = cached_answer(passport_code)
+        if answer:
+            return answer
     try:
-        # Wait for result content to load
-        result_timeout = config.get('timeouts', {}).get('result_wait', 15)
-        time.sleep(3)  # Initial wait
-        
-        # Get page content
-        page_source = driver.page_source
-        soup = BeautifulSoup(page_source, 'html.parser')
-        
-        # Log page title for debugging
-        title = soup.find('title')
-        if title:
-            logging.info(f"📄 Page title: {title.get_text().strip()}")
-        
-        # Look for error messages first
-        error_indicators = [
-            'помилка', 'error', 'невірний', 'incorrect', 'не знайдено', 'not found',
-            'недійсний', 'invalid', 'відсутній', 'missing'
-        ]
-        
-        page_text = soup.get_text().lower()
-        for error_word in error_indicators:
-            if error_word in page_text:
-                logging.warning(f"⚠️ Possible error detected: {error_word}")
-                return {
-                    "status": "INVALID",
-                    "message": "Passport code not found or invalid",
-                    "success": True
-                }
-        
-        # Look for status information
-        status_keywords = [
-            'статус', 'status', 'стан', 'state', 'готовий', 'ready',
-            'видано', 'issued', 'оброблено', 'processed', 'заявку подано', 'submitted'
-        ]
-        
-        # Find status-related content
-        status_found = False
-        status_message = ""
-        
-        # Check for specific status containers
-        status_selectors = [
-            '.status', '.result', '.passport-status', '.document-status',
-            '[class*="status"]', '[class*="result"]', '[id*="status"]', '[id*="result"]'
-        ]
-        
-        for selector in status_selectors:
-            elements = soup.select(selector)
-            for element in elements:
-                text = element.get_text().strip()
-                if text and len(text) > 5:  # Ignore very short text
-                    for keyword in status_keywords:
-                        if keyword in text.lower():
-                            status_found = True
-                            status_message = text
-                            break
-                    if status_found:
-                        break
-            if status_found:
-                break
-        
-        # If no specific status found, get general page content
-        if not status_found:
-            # Look for any meaningful content
-            content_elements = soup.find_all(['p', 'div', 'span', 'td'], string=True)
-            for element in content_elements:
-                text = element.get_text().strip()
-                if text and len(text) > 10:
-                    for keyword in status_keywords:
-                        if keyword in text.lower():
-                            status_message = text
-                            status_found = True
-                            break
-                    if status_found:
-                        break
-        
-        if status_found and status_message:
-            logging.info(f"✅ Status found: {status_message}")
-            
-            # Determine status type based on content
-            status_message_lower = status_message.lower()
-            if any(word in status_message_lower for word in ['готовий', 'ready', 'видано', 'issued']):
-                status_type = "VALID"
-            elif any(word in status_message_lower for word in ['оброблено', 'processed', 'персоналізація', 'personalization']):
-                status_type = "PROCESSING"
-            elif any(word in status_message_lower for word in ['подано', 'submitted', 'заявку', 'application']):
-                status_type = "PROCESSING"
-            else:
-                status_type = "UNKNOWN"
-            
-            return {
-                "status": status_type,
-                "message": status_message,
-                "success": True,
-                "details": {
-                    "checkTime": datetime.now().isoformat(),
-                    "source": "passport.mfa.gov.ua"
-                }
-            }
+        return to_status_dict(get_dispatcher().submit(passport_code, lane))
+    except CircuitOpen as e:
+        logging.info(f"🔌 Circuit open, answering {passport_code} from cache")
+        return cached_status_dict(passport_code, e.retry_after)
+
+def get_store():
+    """Return the SQLite state store, opening it on first use"""
+    global store
+    
+    with engine_lock:
+        if store is None:
+            from state_store import StateStore
+            store = StateStore(config.get('state_db'))
+        return store
+
+def get_scheduler():
+    """Return the webhook subscription scheduler, creating it on first use"""
+    global scheduler
+    
+    state = get_store()
+    with engine_lock:
+        if scheduler is None:
+            from subscriptions import SubscriptionScheduler
+            subscriptions_config = config.get('subscriptions', {})
+            scheduler = SubscriptionScheduler(
+                state,
+                check=run_scheduled_check,
+                interval=subscriptions_config.get('check_interval_seconds', 1800),
+                poll_interval=subscriptions_config.get('poll_interval_seconds', 60)
+            )
+        return scheduler
+
+def to_subscription_dict(subscription):
+    """Public view of a subscription (the secret is only returned on creation)"""
+    return {
+        "id": subscription['id'],
+        "passportCode": subscription['passport_code'],
+        "callbackUrl": subscription['callback_url'],
+        "createdAt": subscription['created_at'],
+        "lastStatus": subscription['last_status'],
+        "lastCheckedAt": subscription['last_checked_at'],
+        "lastDeliveryAt": subscription['last_delivery_at'],
+        "lastDeliveryError": subscription['last_delivery_error']
+    }
+
+def check_passports_in_tabs(passport_codes, fresh=False):
+    """Check several passports in parallel tabs of one browser, yielding as they finish.
+
+    The batch takes one slot of the batch lane for as long as it runs, so
+    it is bounded and counted like pooled checks; if the queue turns it
+    away, the unanswered codes are reported as rejected.
+    """
+    remaining = []
+    for passport_code in passport_codes:
+        answer = None if fresh else cached_answer(passport_code)
+        if answer:
+            yield passport_code, answer
         else:
-            # No clear status found
-            logging.warning("⚠️ No status information found on page")
-            return {
-                "status": "UNKNOWN",
-                "message": "No status information found",
-                "success": True
-            }
-            
-    except Exception as e:
-        logging.error(f"❌ Error extracting status: {e}")
-        return {
-            "status": "ERROR",
-            "message": f"Error extracting status: {str(e)}",
-            "success": False
-        }
+            remaining.append(passport_code)
+    if not remaining:
+        return
+    try:
+        with get_dispatcher().admit(f"a batch of {len(remaining)} tab checks", BATCH):
+            yield from run_tab_batch(remaining)
+    except (QueueFull, QueueTimeout) as e:
+        logging.warning(f"Queue rejected tab batch, {len(remaining)} codes left unchecked")
+        for passport_code in remaining:
+            yield passport_code, rejected_status_dict(e)
+
+def run_tab_batch(passport_codes):
+    """Run an admitted tab batch through the circuit breaker.
+
+    The batch is admitted by the breaker as a whole; while it is open the
+    codes are answered from their last known status.
+    """
+    from circuit_breaker import CircuitOpen
+    try:
+        probe = get_breaker().before_check()
+    except CircuitOpen as e:
+        logging.info(f"🔌 Circuit open, answering {len(passport_codes)} tab checks from cache")
+        for passport_code in passport_codes:
+            yield passport_code, cached_status_dict(passport_code, e.retry_after)
+        return
+    logging.info(f"🔍 Checking {len(passport_codes)} passports in parallel tabs")
+    recorded = False
+    try:
+        for result in get_batch_engine().iter_batch(passport_codes):
+            # Same bookkeeping as a pooled check, so `since`, history and the caches see it;
+            # a batch admitted as the probe is judged by its first result
+            record_result(result, probe and not recorded)
+            recorded = True
+            yield result.passport_code, to_status_dict(result)
+    finally:
+        if not recorded:
+            get_breaker().cancel(probe)
+
+def check_passports_sequentially(passport_codes, fresh=False):
+    """Check passports one after another, yielding each result as it is scraped.
+
+    Once the queue turns a code away, it and every code after it are
+    reported as rejected; the results already checked are kept.
+    """
+    # Pacing comes from the shared rate limiter every check acquires from
+    for index, passport_code in enumerate(passport_codes):
+        try:
+            yield passport_code, check_passport_status(passport_code, lane=BATCH, fresh=fresh)
+        except (QueueFull, QueueTimeout) as e:
+            logging.warning(f"Queue rejected batch at {passport_code}, {len(passport_codes) - index} codes left unchecked")
+            for rejected in passport_codes[index:]:
+                yield rejected, rejected_status_dict(e)
+            return
+
+def rejected_status_dict(error):
+    """Status dict for a batch code the queue had no room for"""
+    return {
+        "status": "REJECTED",
+        "message": str(error),
+        "success": False,
+        "details": {"source": "queue", "retryAfter": int(error.retry_after) + 1}
+    }
+
+def to_passport_item(passport_code, result):
+    """One entry of the /check-multiple response"""
+    return {
+        "passportCode": passport_code,
+        "status": result['status'],
+        "statusText": result['message'],
+        "details": result.get('details', {})
+    }
+
+def requested_stream_format(data):
+    """Streaming format asked for in the body or the Accept header, or None"""
+    stream = data.get('stream')
+    if stream in STREAM_FORMATS:
+        return stream
+    if stream is True:
+        return 'ndjson'
+    for stream, mimetype in STREAM_FORMATS.items():
+        if request.accept_mimetypes.best == mimetype:
+            return stream
+    return None
+
+def stream_results(checked, total, stream):
+    """Response that sends each passport's result as soon as it is ready"""
+    def encode(event, payload):
+        body = json.dumps(payload, ensure_ascii=False)
+        if stream == 'sse':
+            return f"event: {event}\ndata: {body}\n\n"
+        return body + "\n"
+
+    def generate():
+        count = 0
+        try:
+            for passport_code, result in checked:
+                count += 1
+                yield encode('result', {**to_passport_item(passport_code, result), "index": count, "total": total})
+        except Exception as e:
+            logging.error(f"API error while streaming check-multiple: {e}")
+            yield encode('error', {"success": False, "error": f"Internal server error: {str(e)}"})
+            return
+        yield encode('done', {"done": True, "count": count, "timestamp": datetime.now().isoformat()})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_FORMATS[stream],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def busy_response(error):
+    """429 for a full queue, 503 when the wait ran out; both say when to come back"""
+    body = jsonify({
+        "success": False,
+        "error": str(error),
+        "timestamp": datetime.now().isoformat()
+    })
+    return body, 429 if isinstance(error, QueueFull) else 503, {'Retry-After': str(int(error.retry_after) + 1)}
+
+def status_etag(passport_code, result):
+    """Tag over the structured status only, so age and timing fields don't change it"""
+    from state_store import status_fingerprint
+    content = f"{passport_code}\n{result['status']}\n{status_fingerprint(result['message'])}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+def combined_etag(etags):
+    """One tag over several statuses' tags"""
+    return hashlib.sha256("".join(etags).encode('utf-8')).hexdigest()[:32]
+
+def changed_at_iso(changed_at):
+    """changedAt as shown to clients: local ISO time in whole seconds"""
+    return datetime.fromtimestamp(int(changed_at)).isoformat()
+
+def status_changed_at(passport_code):
+    """When the stored status of a code last changed (epoch seconds), or None"""
+    cached = get_store().latest_result(passport_code)
+    return cached['changed_at'] if cached else None
+
+def requested_since(data):
+    """The client's `since` (epoch seconds or ISO 8601, body or query) or If-Modified-Since.
+
+    Returns epoch seconds or None; raises ValueError for a malformed value.
+    """
+    value = data.get('since', request.args.get('since'))
+    if value is None or value == '':
+        if request.if_modified_since:
+            return request.if_modified_since.timestamp()
+        return None
+    return parse_timestamp(value)
+
+def parse_timestamp(value):
+    """Epoch seconds from epoch seconds or an ISO 8601 string; raises ValueError"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+def changed_since(changed_at, since):
+    """Whether a status changed after since, at the one-second resolution of Last-Modified"""
+    return since is None or changed_at is None or int(changed_at) > since
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+def conditional_response(payload, etag, changed_at=None, since=None):
+    """200 with ETag and Last-Modified, or 304 if the client already has this status"""
+    if request.if_none_match.contains_weak(etag) or not changed_since(changed_at, since):
+        response = not_modified(etag)
+    else:
+        response = jsonify(payload)
+        response.set_etag(etag, weak=True)
+    if changed_at is not None:
+        response.last_modified = datetime.fromtimestamp(int(changed_at), timezone.utc)
+    return response
 
 # API Routes
 
@@ -432,17 +582,27 @@ def check_single_passport():
                 "timestamp": datetime.now().isoformat()
             }), 400
         
-        passport_code = data['passportCode'].strip()
+        passport_code = normalize_code(data['passportCode'])
+        code_error = validate_code(passport_code, config.get('passport_code_pattern'))
+        
+        if code_error:
+            return jsonify({
+                "success": False,
+                "error": code_error,
+                "timestamp": datetime.now().isoformat()
+            }), 400
         
-        if not passport_code:
+        try:
+            since = requested_since(data)
+        except ValueError:
             return jsonify({
                 "success": False,
-                "error": "Empty passport code",
+                "error": "since must be epoch seconds or an ISO 8601 timestamp",
                 "timestamp": datetime.now().isoformat()
             }), 400
         
         # Check passport
-        result = check_passport_status(passport_code)
+        result = check_passport_status(passport_code, fresh=wants_fresh(data))
         
         if result['success']:
             # Convert to mobile app format
@@ -452,19 +612,31 @@ def check_single_passport():
                 "statusText": result['message'],
                 "details": result.get('details', {})
             }
+            changed_at = status_changed_at(passport_code)
+            if changed_at is not None:
+                api_response['details']['changedAt'] = changed_at_iso(changed_at)
             
-            return jsonify({
+            # 304 if the client's ETag or `since` shows it already has this status
+            return conditional_response({
                 "success": True,
                 "data": api_response,
                 "timestamp": datetime.now().isoformat()
-            }), 200
+            }, status_etag(passport_code, result), changed_at, since)
         else:
-            return jsonify({
+            body = jsonify({
                 "success": False,
                 "error": result['message'],
                 "timestamp": datetime.now().isoformat()
-            }), 500
+            })
+            if result['status'] == 'TIMEOUT':
+                return body, 504
+            retry_after = result['details'].get('retryAfter')
+            if retry_after is not None:
+                return body, 503, {'Retry-After': str(max(1, retry_after))}
+            return body, 500
             
+    except (QueueFull, QueueTimeout) as e:
+        return busy_response(e)
     except Exception as e:
         logging.error(f"API error in check_single_passport: {e}")
         return jsonify({
@@ -495,46 +667,295 @@ def check_multiple_passports():
                 "timestamp": datetime.now().isoformat()
             }), 400
         
-        results = []
-        
+        codes = []
+        valid_codes = []
+        rejected = []
         for passport_code in passport_codes:
-            if passport_code.strip():
-                result = check_passport_status(passport_code.strip())
-                
-                api_response = {
-                    "passportCode": passport_code.strip(),
-                    "status": result['status'],
-                    "statusText": result['message'],
-                    "details": result.get('details', {})
-                }
-                results.append(api_response)
-                
-                # Add delay between requests to avoid rate limiting
-                time.sleep(random.uniform(2, 5))
+            passport_code = normalize_code(passport_code)
+            if not passport_code or passport_code in codes:
+                continue
+            codes.append(passport_code)
+            code_error = validate_code(passport_code, config.get('passport_code_pattern'))
+            if code_error:
+                rejected.append((passport_code, invalid_code_dict(code_error)))
+            else:
+                valid_codes.append(passport_code)
+        
+        try:
+            since = requested_since(data)
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "since must be epoch seconds or an ISO 8601 timestamp",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        # Malformed codes are answered up front and never reach a browser
+        mode = data.get('mode', config.get('batch', {}).get('mode', 'sequential'))
+        
+        if mode == 'tabs':
+            checked = itertools.chain(rejected, check_passports_in_tabs(valid_codes, wants_fresh(data)))
+        else:
+            checked = itertools.chain(rejected, check_passports_sequentially(valid_codes, wants_fresh(data)))
+        
+        stream = requested_stream_format(data)
+        if stream:
+            return stream_results(checked, len(codes), stream)
+        
+        # Tabs finish in any order; keep the response in request order
+        by_code = dict(checked)
+        results = [to_passport_item(code, by_code[code]) for code in codes]
+        retry_after = max(
+            (result['details']['retryAfter'] for result in by_code.values() if result['status'] == 'REJECTED'),
+            default=None
+        )
+        
+        # One tag over every code's status; with `since` only changed codes are listed
+        etag = combined_etag(status_etag(code, by_code[code]) for code in codes)
+        if since is not None:
+            results = [
+                item for item in results
+                if not by_code[item['passportCode']]['success']
+                or changed_since(status_changed_at(item['passportCode']), since)
+            ]
+            if not results:
+                return not_modified(etag)
+        
+        response = conditional_response({
+            "success": True,
+            "data": results,
+            "timestamp": datetime.now().isoformat()
+        }, etag)
+        if retry_after is not None:
+            # Some codes were turned away; say when the rest can be sent again
+            response.headers['Retry-After'] = str(retry_after)
+        return response
         
+    except (QueueFull, QueueTimeout) as e:
+        return busy_response(e)
+    except Exception as e:
+        logging.error(f"API error in check_multiple_passports: {e}")
         return jsonify({
+            "success": False,
+            "error": f"Internal server error: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/statuses', methods=['GET', 'POST'])
+def stored_statuses():
+    """Known statuses of many codes, straight from the state store; never starts a check"""
+    try:
+        if request.method == 'POST':
+            passport_codes = (request.get_json(silent=True) or {}).get('passportCodes')
+        else:
+            passport_codes = request.args.getlist('code') or request.args.get('codes', '').split(',')
+        
+        if not isinstance(passport_codes, list):
+            return jsonify({
+                "success": False,
+                "error": "Invalid passport codes format",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        codes = list(dict.fromkeys(code for code in map(normalize_code, passport_codes) if code))
+        max_codes = config.get('statuses_max_codes', 5000)
+        if not codes or len(codes) > max_codes:
+            return jsonify({
+                "success": False,
+                "error": f"Pass between 1 and {max_codes} passport codes",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        stored = get_store().latest_results(codes)
+        ttl = config.get('cache', {}).get('ttl_seconds', 600)
+        results = []
+        missing = []
+        etags = []
+        for passport_code in codes:
+            cached = stored.get(passport_code)
+            if not cached:
+                missing.append(passport_code)
+                continue
+            result = stored_status_dict(
+                cached, changedAt=changed_at_iso(cached['changed_at']), stale=cached['age'] >= ttl
+            )
+            results.append(to_passport_item(passport_code, result))
+            etags.append(status_etag(passport_code, result))
+        
+        return conditional_response({
             "success": True,
             "data": results,
+            "missing": missing,
+            "timestamp": datetime.now().isoformat()
+        }, combined_etag(etags + missing))
+        
+    except Exception as e:
+        logging.error(f"API error in stored_statuses: {e}")
+        return jsonify({
+            "success": False,
+            "error": f"Internal server error: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+def encode_cursor(key):
+    """Opaque page cursor for a (stored_at, id) history key"""
+    stored_at, row_id = key
+    return base64.urlsafe_b64encode(f"{stored_at!r}:{row_id}".encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+    """(stored_at, id) from a page cursor; raises ValueError"""
+    try:
+        stored_at, row_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split(':')
+        return float(stored_at), int(row_id)
+    except (UnicodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+def to_history_item(row):
+    """One entry of the /history response"""
+    return {
+        "status": row['status'],
+        "statusText": row['text'],
+        "checkTime": row['checked_at'],
+        "storedAt": datetime.fromtimestamp(row['stored_at']).isoformat(),
+        "strategy": row['strategy'],
+        "changed": bool(row['changed'])
+    }
+
+@app.route('/history/<passport_code>', methods=['GET'])
+def status_history(passport_code):
+    """Stored results of one code, newest first, a page at a time"""
+    try:
+        passport_code = normalize_code(passport_code)
+        code_error = validate_code(passport_code, config.get('passport_code_pattern'))
+        if code_error:
+            return jsonify({
+                "success": False,
+                "error": code_error,
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        try:
+            start = request.args.get('from')
+            end = request.args.get('to')
+            cursor = request.args.get('cursor')
+            rows, next_key = get_store().history(
+                passport_code,
+                start=parse_timestamp(start) if start else None,
+                end=parse_timestamp(end) if end else None,
+                before=decode_cursor(cursor) if cursor else None,
+                limit=min(max(request.args.get('limit', 50, type=int), 1), 500)
+            )
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "from/to must be epoch seconds or ISO 8601 timestamps and cursor must come from nextCursor",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        return jsonify({
+            "success": True,
+            "passportCode": passport_code,
+            "data": [to_history_item(row) for row in rows],
+            "nextCursor": encode_cursor(next_key) if next_key else None,
             "timestamp": datetime.now().isoformat()
         }), 200
         
     except Exception as e:
-        logging.error(f"API error in check_multiple_passports: {e}")
+        logging.error(f"API error in status_history: {e}")
         return jsonify({
             "success": False,
             "error": f"Internal server error: {str(e)}",
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/subscriptions', methods=['POST'])
+def create_subscription():
+    """Subscribe a callback URL to status changes of one passport"""
+    try:
+        data = request.get_json(silent=True) or {}
+        passport_code = normalize_code(data.get('passportCode'))
+        callback_url = str(data.get('callbackUrl', '')).strip()
+        
+        if not passport_code or not callback_url.startswith(('http://', 'https://')):
+            return jsonify({
+                "success": False,
+                "error": "passportCode and an http(s) callbackUrl are required",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        code_error = validate_code(passport_code, config.get('passport_code_pattern'))
+        if code_error:
+            return jsonify({
+                "success": False,
+                "error": code_error,
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        from subscriptions import new_subscription_id, new_secret
+        secret = str(data.get('secret') or new_secret())
+        subscription = get_store().add_subscription(new_subscription_id(), passport_code, callback_url, secret)
+        get_scheduler().start()
+        logging.info(f"🔔 New subscription {subscription['id']} for {passport_code} -> {callback_url}")
+        
+        return jsonify({
+            "success": True,
+            "data": {**to_subscription_dict(subscription), "secret": secret},
+            "timestamp": datetime.now().isoformat()
+        }), 201
+        
+    except Exception as e:
+        logging.error(f"API error in create_subscription: {e}")
+        return jsonify({
+            "success": False,
+            "error": f"Internal server error: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/subscriptions/<subscription_id>', methods=['GET'])
+def get_subscription(subscription_id):
+    """Show a subscription and its last check and delivery"""
+    subscription = get_store().get_subscription(subscription_id)
+    if not subscription:
+        return jsonify({
+            "success": False,
+            "error": "Subscription not found",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return jsonify({
+        "success": True,
+        "data": to_subscription_dict(subscription),
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+@app.route('/subscriptions/<subscription_id>', methods=['DELETE'])
+def delete_subscription(subscription_id):
+    """Stop sending webhooks for a subscription"""
+    if not get_store().remove_subscription(subscription_id):
+        return jsonify({
+            "success": False,
+            "error": "Subscription not found",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return jsonify({
+        "success": True,
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
 @app.route('/status', methods=['GET'])
 def api_status():
     """Get API status and statistics"""
+    import rate_limiter
     return jsonify({
         "service": "Ukraine Passport Checker API",
         "version": "1.0.0",
         "status": "running",
         "timestamp": datetime.now().isoformat(),
-        "driver_status": "initialized" if driver else "not_initialized"
+        "driver_status": "initialized" if pool and pool.started else "not_initialized",
+        "workers": pool.status() if pool else None,
+        "rateLimit": rate_limiter.default_limiter().stats(),
+        "circuitBreaker": breaker.stats() if breaker else None,
+        "queue": dispatcher.status() if dispatcher else None,
+        "cache": status_cache.stats() if status_cache else None
     }), 200
 
 if __name__ == '__main__':
@@ -544,15 +965,31 @@ if __name__ == '__main__':
     # Load configuration
     load_config()
     
-    # Initialize driver
-    setup_driver()
+    # Batch checks in this process and the worker processes share one request budget
+    import rate_limiter
+    rate_limiter.configure(config.get('rate_limit'))
+    
+    # Debug pages from this process and the workers go to one artifact store
+    import artifact_store
+    artifact_store.configure(config.get('artifacts'))
+    
+    # Start the browser workers in the background so /health answers
+    # immediately; this also patches and caches chromedriver on the first run
+    threading.Thread(target=setup_driver, daemon=True).start()
+    
+    # Resume checking codes that already have webhook subscriptions
+    get_scheduler().start()
     
     print("Starting Ukraine Passport Checker API Server...")
     print("Mobile app can connect to: http://localhost:8000")
     print("Available endpoints:")
     print("   GET  /health - Health check")
     print("   POST /check-passport - Check single passport")
-    print("   POST /check-multiple - Check multiple passports")
+    print("   POST /check-multiple - Check multiple passports (add \"stream\": \"ndjson\" or \"sse\" for progressive results)")
+    print("   GET|POST /statuses - Stored statuses of many codes, without checking")
+    print("   GET  /history/<code> - Paginated status history of one code")
+    print("   POST /subscriptions - Get webhooks when a passport's status changes")
+    print("   GET|DELETE /subscriptions/<id> - Inspect or cancel a subscription")
     print("   GET  /status - API status")
     print("\nPress Ctrl+C to stop the server")
     
@@ -566,17 +1003,17 @@ if __name__ == '__main__':
         )
     except KeyboardInterrupt:
         print("Shutting down server...")
-        if driver:
-            try:
-                driver.quit()
-                print("Browser closed")
-            except:
-                pass
+        if scheduler:
+            scheduler.stop()
+        if status_cache:
+            status_cache.stop()
+        if pool:
+            pool.close()
+            print("Browser closed")
+        if batch_engine:
+            batch_engine.close()
         print("Server stopped")
     except Exception as e:
         logging.error(f"❌ Server error: {e}")
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+        if pool:
+            pool.close()
@@ -0,0 +1,385 @@
+"""
+Content-addressed store for the debug pages saved during checks
+A page is stored once per distinct content as a compressed blob named by its
+SHA-256 (zstd when the zstandard package is installed, gzip otherwise), and an
+index records which code and kind every capture belongs to. Pages are hashed,
+compressed and written on a background thread so a check never waits for the
+disk, and captures past the age or size limit are pruned along with blobs
+nothing refers to any more.
+
+Usage: python artifact_store.py [list [code] | show <digest> | import-logs | prune]
+"""
+import os
+import sys
+import glob
+import gzip
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+
+DEFAULT_SETTINGS = {
+    "path": os.path.join(LOGS_DIR, 'artifacts'),
+    "max_age_days": 14,
+    "max_megabytes": 200,
+    "compression": "auto",
+}
+
+# Debug pages written straight into logs/ before this store existed
+LEGACY_PATTERNS = ['debug_page_*.html', 'ajax_status_*.html', 'ultra_debug_*.html']
+
+# Prune after this many new captures, besides once at startup
+PRUNE_EVERY = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    passport_code TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captures_code ON captures (passport_code, created_at);
+CREATE INDEX IF NOT EXISTS captures_digest ON captures (digest);
+CREATE INDEX IF NOT EXISTS captures_time ON captures (created_at);
+"""
+
+CODEC_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+
+def pick_codec(compression="auto"):
+    if compression in ("auto", "zstd") and zstandard is not None:
+        return "zstd"
+    if compression == "zstd":
+        logging.warning("zstandard not installed, compressing debug pages with gzip")
+    return "gzip"
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This artifact is zstd-compressed; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class ArtifactStore:
+    """Deduplicated, compressed debug pages with a per-code index and retention.
+
+    save() only hashes the page and queues it; the writer thread compresses
+    it, stores the blob if its digest is new and records the capture. Any
+    number of processes can share one store directory.
+    """
+
+    def __init__(self, path=None, max_age_days=14, max_megabytes=200, compression="auto", max_pending=100):
+        self.path = path or DEFAULT_SETTINGS["path"]
+        self.max_age = max_age_days * 86400
+        self.max_bytes = int(max_megabytes * 1024 * 1024)
+        self.codec = pick_codec(compression)
+        os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+        self.lock = threading.Lock()
+        # Autocommit, so transaction() can take SQLite's write lock up front
+        self.db = sqlite3.connect(
+            os.path.join(self.path, 'index.db'), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.db.row_factory = sqlite3.Row
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.since_prune = 0
+        self.thread = None
+        self.dropped = 0
+
+    def save(self, html, kind, passport_code=None):
+        """Queue a page for storage and return its digest; never blocks the caller"""
+        data = html.encode('utf-8') if isinstance(html, str) else html
+        digest = hashlib.sha256(data).hexdigest()
+        self._start()
+        try:
+            self.pending.put_nowait((digest, data, kind, passport_code, time.time()))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"⚠️ Artifact writer is behind, dropping {kind} page {digest[:12]}")
+        return digest
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name='artifact-writer', daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        try:
+            self.prune()
+        except Exception as e:
+            logging.error(f"❌ Artifact pruning failed: {e}")
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    return
+                self.write(*item)
+                self.since_prune += 1
+                if self.since_prune >= PRUNE_EVERY:
+                    self.prune()
+            except Exception as e:
+                logging.error(f"❌ Could not store debug page: {e}")
+            finally:
+                self.pending.task_done()
+
+    @contextmanager
+    def transaction(self):
+        """Hold SQLite's write lock, which every process sharing the store honours"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def write(self, digest, data, kind, passport_code=None, created_at=None):
+        """Store one capture synchronously; the blob is only written if its digest is new"""
+        created_at = created_at or time.time()
+        with self.lock:
+            known = self.db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        # Compress before taking the write lock; most pages repeat and skip this
+        blob = None if known else compress(data, self.codec)
+        with self.transaction() as db:
+            # Checked again under the lock: prune() may have removed the blob meanwhile
+            if not db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone():
+                blob = blob or compress(data, self.codec)
+                self._write_blob(digest, blob)
+                db.execute(
+                    "INSERT INTO blobs (digest, codec, size, raw_size, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (digest, self.codec, len(blob), len(data), created_at)
+                )
+            db.execute(
+                "INSERT INTO captures (digest, kind, passport_code, created_at) VALUES (?, ?, ?, ?)",
+                (digest, kind, passport_code, created_at)
+            )
+
+    def _write_blob(self, digest, blob):
+        blob_path = self.blob_path(digest, self.codec)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # Write then rename so readers never see a partial blob
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(temp_path, blob_path)
+
+    def blob_path(self, digest, codec):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.html' + CODEC_SUFFIXES[codec])
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, params).fetchall()]
+
+    def load(self, digest):
+        """The page stored under digest (or a unique prefix of it), or None"""
+        rows = self.query("SELECT digest, codec FROM blobs WHERE digest LIKE ? LIMIT 2", (digest + '%',))
+        if len(rows) != 1:
+            return None
+        with open(self.blob_path(rows[0]['digest'], rows[0]['codec']), 'rb') as f:
+            return decompress(f.read(), rows[0]['codec']).decode('utf-8', errors='replace')
+
+    def captures_for(self, passport_code, limit=50):
+        """A code's most recent captures, newest first"""
+        return self.query(
+            "SELECT * FROM captures WHERE passport_code = ? ORDER BY created_at DESC LIMIT ?", (passport_code, limit)
+        )
+
+    def recent_captures(self, limit=50):
+        return self.query("SELECT * FROM captures ORDER BY created_at DESC LIMIT ?", (limit,))
+
+    def pages(self, kinds=None):
+        """(digest, kind, html) for every distinct stored page, optionally of the given kinds"""
+        sql = "SELECT digest, MIN(kind) AS kind FROM captures"
+        params = ()
+        if kinds:
+            sql += f" WHERE kind IN ({', '.join('?' for _ in kinds)})"
+            params = tuple(kinds)
+        for row in self.query(sql + " GROUP BY digest ORDER BY digest", params):
+            html = self.load(row['digest'])
+            if html is not None:
+                yield row['digest'], row['kind'], html
+
+    def prune(self):
+        """Drop captures older than max_age, then the least recently seen blobs until under max_bytes"""
+        self.since_prune = 0
+        # Blob files are unlinked under the write lock, so no other process can
+        # reference a blob between it being found orphaned and deleted
+        with self.transaction() as db:
+            removed = db.execute(
+                "DELETE FROM captures WHERE created_at < ?", (time.time() - self.max_age,)
+            ).rowcount
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total > self.max_bytes:
+                rows = db.execute(
+                    "SELECT blobs.digest, blobs.size FROM blobs LEFT JOIN captures USING (digest) "
+                    "GROUP BY blobs.digest ORDER BY COALESCE(MAX(captures.created_at), 0)"
+                ).fetchall()
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    removed += db.execute("DELETE FROM captures WHERE digest = ?", (row['digest'],)).rowcount
+                    total -= row['size']
+            orphans = db.execute(
+                "SELECT digest, codec FROM blobs WHERE NOT EXISTS "
+                "(SELECT 1 FROM captures WHERE captures.digest = blobs.digest)"
+            ).fetchall()
+            db.executemany("DELETE FROM blobs WHERE digest = ?", [(row['digest'],) for row in orphans])
+            for row in orphans:
+                try:
+                    os.remove(self.blob_path(row['digest'], row['codec']))
+                except FileNotFoundError:
+                    pass
+        if removed or orphans:
+            logging.info(f"🧹 Pruned {removed} debug captures and {len(orphans)} stored pages")
+        return removed, len(orphans)
+
+    def import_legacy_files(self, logs_dir=LOGS_DIR):
+        """Move the loose logs/*.html debug pages into the store; returns how many were imported"""
+        count = 0
+        for pattern in LEGACY_PATTERNS:
+            kind = pattern.split('_*')[0]
+            for path in sorted(glob.glob(os.path.join(logs_dir, pattern))):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self.write(hashlib.sha256(data).hexdigest(), data, kind, created_at=os.path.getmtime(path))
+                os.remove(path)
+                count += 1
+        return count
+
+    def flush(self):
+        """Wait until every queued page is written"""
+        if self.thread is not None:
+            self.pending.join()
+
+    def stats(self):
+        with self.lock:
+            blobs = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM blobs").fetchone()
+            captures = self.db.execute("SELECT COUNT(*) FROM captures").fetchone()[0]
+        return {
+            "captures": captures,
+            "pages": blobs[0],
+            "storedBytes": blobs[1],
+            "rawBytes": blobs[2],
+            "pending": self.pending.qsize(),
+            "dropped": self.dropped,
+            "codec": self.codec,
+        }
+
+    def close(self):
+        """Finish the queued writes and stop the writer thread"""
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join(timeout=10)
+            self.thread = None
+
+
+_store = None
+_store_settings = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def create_store(settings=None):
+    """Build a store from the artifacts section of config.json"""
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    return ArtifactStore(settings["path"], settings["max_age_days"], settings["max_megabytes"], settings["compression"])
+
+
+def configure(settings=None):
+    """Set the store save_debug_html writes to in this process.
+
+    Calling it again with the same settings keeps the current store. A
+    forked child opens its own instead of using the parent's connection.
+    """
+    global _store, _store_settings, _store_pid
+    with _store_lock:
+        if _store is None or settings != _store_settings or _store_pid != os.getpid():
+            if _store is not None and _store_pid == os.getpid():
+                _store.close()
+            _store = create_store(settings)
+            _store_settings = settings
+            _store_pid = os.getpid()
+        return _store
+
+
+def default_store():
+    """The process-wide store, created with default settings if not configured"""
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            _store = create_store()
+            _store_pid = os.getpid()
+        return _store
+
+
+@atexit.register
+def _close_default_store():
+    # Don't lose the page of the check that ran last before exit
+    if _store is not None and _store_pid == os.getpid():
+        _store.close()
+
+
+def main(args):
+    store = default_store()
+    command = args[0] if args else 'list'
+    if command == 'list':
+        captures = store.captures_for(args[1]) if len(args) > 1 else store.recent_captures()
+        for capture in captures:
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(capture['created_at']))
+            print(f"{created}  {capture['digest'][:12]}  {capture['kind']:<12} {capture['passport_code'] or '-'}")
+        print(store.stats())
+    elif command == 'show' and len(args) > 1:
+        html = store.load(args[1])
+        if html is None:
+            print(f"No single stored page matches {args[1]}")
+            return 1
+        sys.stdout.write(html)
+    elif command == 'import-logs':
+        print(f"Imported {store.import_legacy_files()} debug pages from {LOGS_DIR}")
+        store.prune()
+        print(store.stats())
+    elif command == 'prune':
+        removed, orphans = store.prune()
+        print(f"Removed {removed} captures and {orphans} pages")
+        print(store.stats())
+    else:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
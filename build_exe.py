@@ -81,6 +81,8 @@ a = Analysis(
         'bs4.builder.html',
         'bs4.builder._html5lib',
         'bs4.builder._lxml',
+        'lxml',
+        'lxml.etree',
         'flask',
         'flask_cors',
         'smtplib',
@@ -0,0 +1,627 @@
+"""
+asyncio passport check engine over the Chrome DevTools Protocol
+Drives Chrome directly through its DevTools WebSocket (no chromedriver hop),
+runs humanization delays as asyncio sleeps and multiplexes many tabs from a
+single event loop
+
+Usage: python cdp_engine.py <passport_code> [<passport_code> ...]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import logging
+import tempfile
+import itertools
+import threading
+import queue
+
+import websockets
+
+import passport_check as pc
+from check_engine import (
+    BASE_URL, DEFAULT_TIMEOUTS, INPUT_SELECTORS, BUTTON_SELECTORS,
+    CheckResult, classify_status, ERROR, TIMEOUT,
+)
+import rate_limiter
+import keystrokes
+from deadline import DeadlineExceeded, as_deadline
+
+# Event each page load strategy waits for after a navigation
+LOAD_EVENTS = {
+    'normal': 'Page.loadEventFired',
+    'eager': 'Page.domContentEventFired',
+    'none': None,
+}
+
+# The execute_script probe from passport_check, turned into a boolean CDP expression
+CLOUDFLARE_CHALLENGE_EXPRESSION = f"""(function() {{
+    const state = (function() {{ {pc.CLOUDFLARE_PROBE_SCRIPT} }})();
+    const title = (state.title || '').toLowerCase();
+    return state.challenge || {json.dumps(pc.CLOUDFLARE_TITLE_INDICATORS)}.some(t => title.includes(t));
+}})()"""
+
+FIND_AND_FOCUS_SCRIPT = """
+(function(selectors) {
+    for (const selector of selectors) {
+        let el = null;
+        try {
+            el = selector.startsWith('//')
+                ? document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue
+                : document.querySelector(selector);
+        } catch (e) {
+            continue;
+        }
+        if (el && el.offsetParent !== null) {
+            el.scrollIntoView({block: 'center'});
+            el.focus();
+            if ('value' in el && el.tagName === 'INPUT' && el.type !== 'submit') { el.value = ''; }
+            const r = el.getBoundingClientRect();
+            return {x: r.left + r.width / 2, y: r.top + r.height / 2, selector: selector};
+        }
+    }
+    return null;
+})(%s)
+"""
+
+RESULT_READY_EXPRESSION = """
+(function() {
+    const el = document.getElementById('statusResultId');
+    return !!(el && el.innerText && el.innerText.trim().length > 0);
+})()
+"""
+
+RESULT_HTML_EXPRESSION = """
+(function() {
+    const el = document.getElementById('statusResultId');
+    return el ? el.outerHTML : '';
+})()
+"""
+
+
+class CDPError(Exception):
+    """A DevTools command returned an error"""
+
+
+# Errors from evaluating while the page navigates or Cloudflare reloads it
+NAVIGATION_ERRORS = (
+    'execution context was destroyed',
+    'cannot find context',
+    'inspected target navigated or closed',
+)
+
+
+def is_navigation_error(error):
+    """True if a CDPError only means the page was between documents"""
+    message = str(error).lower()
+    return any(text in message for text in NAVIGATION_ERRORS)
+
+
+class CDPConnection:
+    """One WebSocket to the browser; tabs are multiplexed as flattened sessions"""
+
+    def __init__(self, ws_url):
+        self.ws_url = ws_url
+        self.ws = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.listeners = []
+        self.reader = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.ws_url, max_size=None)
+        self.reader = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self.pending.pop(message['id'], None)
+                    if future and not future.done():
+                        if 'error' in message:
+                            future.set_exception(CDPError(message['error'].get('message', message['error'])))
+                        else:
+                            future.set_result(message.get('result', {}))
+                else:
+                    for listener in list(self.listeners):
+                        listener(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(CDPError("DevTools connection closed"))
+            self.pending.clear()
+
+    async def send(self, method, params=None, session_id=None, timeout=30):
+        message_id = next(self.ids)
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        await self.ws.send(json.dumps(message))
+        return await asyncio.wait_for(future, timeout)
+
+    async def wait_for_event(self, method, session_id=None, timeout=30):
+        """Wait for the next event with this method (and session)"""
+        future = asyncio.get_running_loop().create_future()
+
+        def listener(message):
+            if message.get('method') == method and message.get('sessionId') == session_id and not future.done():
+                future.set_result(message.get('params', {}))
+
+        self.listeners.append(listener)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.listeners.remove(listener)
+
+    @property
+    def closed(self):
+        """True once the WebSocket is gone, e.g. because Chrome exited"""
+        return self.reader is None or self.reader.done()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+
+class Tab:
+    """A browser tab attached over a flattened CDP session"""
+
+    def __init__(self, conn, target_id, session_id, load_event=LOAD_EVENTS['normal']):
+        self.conn = conn
+        self.target_id = target_id
+        self.session_id = session_id
+        self.load_event = load_event
+
+    @classmethod
+    async def open(cls, conn, user_agent=None, page_load=None):
+        page_load = page_load or pc.page_load_settings()
+        target = await conn.send('Target.createTarget', {'url': 'about:blank'})
+        attached = await conn.send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+        tab = cls(conn, target['targetId'], attached['sessionId'], LOAD_EVENTS[page_load['strategy']])
+        await tab.send('Page.enable')
+        await tab.send('Runtime.enable')
+        await tab.send('Page.addScriptToEvaluateOnNewDocument', {'source': pc.EARLY_STEALTH_SCRIPT})
+        blocked = pc.blocked_url_patterns(page_load)
+        if blocked:
+            await tab.send('Network.enable')
+            await tab.send('Network.setBlockedURLs', {'urls': blocked})
+        if user_agent:
+            await tab.send('Network.setUserAgentOverride', {
+                'userAgent': user_agent,
+                'acceptLanguage': pc.PREFERRED_LANGUAGE,
+                'platform': 'Windows'
+            })
+        return tab
+
+    async def send(self, method, params=None, timeout=30):
+        return await self.conn.send(method, params, session_id=self.session_id, timeout=timeout)
+
+    async def navigate(self, url, timeout=30):
+        await self._load('Page.navigate', {'url': url}, timeout)
+
+    async def reload(self, timeout=30):
+        await self._load('Page.reload', None, timeout)
+
+    async def _load(self, method, params, timeout):
+        """Send a navigation command and wait for the page load strategy's event"""
+        if self.load_event is None:
+            # "none": Page.navigate already answers once the new document is committed
+            await self.send(method, params, timeout)
+            return
+        loaded = asyncio.ensure_future(self.conn.wait_for_event(self.load_event, self.session_id, timeout))
+        await self.send(method, params)
+        await loaded
+
+    async def evaluate(self, expression):
+        response = await self.send('Runtime.evaluate', {
+            'expression': expression,
+            'returnByValue': True,
+            'awaitPromise': True,
+        })
+        if 'exceptionDetails' in response:
+            raise CDPError(response['exceptionDetails'].get('text', 'evaluation failed'))
+        return response.get('result', {}).get('value')
+
+    async def poll(self, expression):
+        """Evaluate for a poll loop: None while the page is between documents"""
+        try:
+            return await self.evaluate(expression)
+        except CDPError as e:
+            if not is_navigation_error(e):
+                raise
+            logging.debug(f"Page navigating, will poll again: {e}")
+            return None
+
+    async def wait_for(self, expression, timeout, poll_interval=0.5):
+        """Poll a boolean expression until it is true or timeout passes"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if await self.poll(expression):
+                return True
+            await asyncio.sleep(poll_interval)
+        return False
+
+    async def find_and_focus(self, selectors, timeout):
+        """Focus the first visible element matching selectors; returns its center point"""
+        expression = FIND_AND_FOCUS_SCRIPT % json.dumps(selectors)
+        deadline = time.monotonic() + timeout
+        while True:
+            point = await self.poll(expression)
+            if point or time.monotonic() >= deadline:
+                return point
+            await asyncio.sleep(0.5)
+
+    async def type_text(self, text, style=keystrokes.NORMAL):
+        """Type along a locally generated keystroke timeline with trusted key events.
+
+        Every event is sent at its planned offset from the start, so the
+        round trip of each command is absorbed instead of added to the rhythm.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        offset = 0.0
+        for char, delay, hold in keystrokes.keystroke_timeline(text, style):
+            key = keystrokes.cdp_key(char)
+            offset += delay
+            await asyncio.sleep(max(0.0, started + offset - loop.time()))
+            await self.send('Input.dispatchKeyEvent', {'type': 'keyDown', **key})
+            offset += hold
+            await asyncio.sleep(max(0.0, started + offset - loop.time()))
+            await self.send('Input.dispatchKeyEvent', {'type': 'keyUp', 'key': char, 'code': key.get('code', '')})
+
+    async def click(self, x, y):
+        for event in ('mouseMoved', 'mousePressed', 'mouseReleased'):
+            await self.send('Input.dispatchMouseEvent', {
+                'type': event, 'x': x, 'y': y, 'button': 'left', 'clickCount': 1
+            })
+            await asyncio.sleep(random.uniform(0.03, 0.1))
+
+    async def close(self):
+        try:
+            await self.conn.send('Target.closeTarget', {'targetId': self.target_id}, timeout=5)
+        except Exception as e:
+            logging.debug(f"Closing tab failed: {e}")
+
+
+class AsyncCheckEngine:
+    """Runs passport checks in tabs of one Chrome controlled over CDP.
+
+    check() may be awaited concurrently; every call gets its own tab and all
+    waiting happens on the event loop rather than in blocked threads. At most
+    max_tabs checks run at once in this browser. A check that outlives its
+    deadline is cancelled mid-flight and its tab closed.
+    """
+
+    def __init__(self, timeouts=None, headless=False, humanize=True, chrome_path=None, max_tabs=3,
+                 deadline_seconds=None, limiter=None, page_load=None):
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.page_load = pc.page_load_settings({'page_load': page_load})
+        self.deadline_seconds = deadline_seconds
+        self.limiter = limiter or rate_limiter.default_limiter()
+        self.headless = headless
+        self.humanize = humanize
+        self.chrome_path = chrome_path
+        self.max_tabs = max_tabs
+        self.tab_slots = None
+        self.clear_lock = None
+        self.challenge_cleared = False
+        self.process = None
+        self.profile_dir = None
+        self.conn = None
+        self.user_agent = None
+
+    async def start(self):
+        """Launch Chrome with remote debugging and connect to its browser target"""
+        chrome = self.chrome_path or find_chrome()
+        if not chrome:
+            raise RuntimeError("Could not find a Chrome executable")
+
+        self.profile_dir = tempfile.mkdtemp(prefix='passport_cdp_')
+        args = [
+            chrome,
+            '--remote-debugging-port=0',
+            f'--user-data-dir={self.profile_dir}',
+            '--no-first-run',
+            '--no-default-browser-check',
+            '--disable-dev-shm-usage',
+            '--lang=uk-UA',
+            '--window-size=1366,768',
+            'about:blank',
+        ]
+        if self.headless:
+            args.insert(1, '--headless=new')
+
+        logging.info("Launching Chrome for CDP engine...")
+        self.process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        ws_url = await self._read_devtools_url()
+        self.conn = CDPConnection(ws_url)
+        await self.conn.connect()
+
+        self.tab_slots = asyncio.Semaphore(self.max_tabs)
+        self.clear_lock = asyncio.Lock()
+        version = await self.conn.send('Browser.getVersion')
+        self.user_agent = version.get('userAgent', '').replace('HeadlessChrome', 'Chrome') or None
+        logging.info(f"Connected to {version.get('product')} over CDP")
+        return self
+
+    async def _read_devtools_url(self, timeout=20):
+        port_file = os.path.join(self.profile_dir, 'DevToolsActivePort')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.returncode is not None:
+                raise RuntimeError(f"Chrome exited with code {self.process.returncode}")
+            try:
+                with open(port_file, 'r', encoding='utf-8') as f:
+                    lines = f.read().split()
+                if len(lines) >= 2:
+                    return f"ws://127.0.0.1:{lines[0]}{lines[1]}"
+            except FileNotFoundError:
+                pass
+            await asyncio.sleep(0.1)
+        raise RuntimeError("Chrome did not expose a DevTools endpoint")
+
+    async def pause(self, min_seconds, max_seconds):
+        if self.humanize:
+            await asyncio.sleep(random.uniform(min_seconds, max_seconds))
+
+    async def wait_for_cloudflare(self, tab, max_retries=3, timeout=20):
+        for attempt in range(max_retries):
+            if await tab.wait_for(f"!{CLOUDFLARE_CHALLENGE_EXPRESSION}", timeout):
+                return True
+            logging.warning(f"Cloudflare still shown after {timeout}s, reloading ({attempt + 1}/{max_retries})")
+            await tab.reload()
+        return False
+
+    async def clear_challenge(self):
+        """Get one tab past Cloudflare so later tabs inherit the clearance cookies"""
+        async with self.clear_lock:
+            if self.challenge_cleared:
+                return
+            deadline = as_deadline(self.deadline_seconds)
+            await asyncio.get_running_loop().run_in_executor(None, self.limiter.acquire, deadline)
+            tab = await Tab.open(self.conn, self.user_agent, self.page_load)
+            try:
+                await tab.navigate(BASE_URL)
+                if not await self.wait_for_cloudflare(tab):
+                    raise RuntimeError("Could not bypass Cloudflare or anti-bot protection")
+                self.challenge_cleared = True
+                logging.info("Browser cleared Cloudflare; tabs will reuse its cookies")
+            finally:
+                await tab.close()
+
+    async def check(self, passport_code, deadline=None):
+        """Check one passport code in a fresh tab and return a CheckResult.
+
+        An explicit deadline bounds the whole call, waiting for a tab and a
+        token included. Without one, deadline_seconds starts only once the
+        check has both, so codes queued behind a large batch are not timed
+        out before they get to run.
+        """
+        wait_deadline = as_deadline(deadline)
+        # Tab first: a token taken while waiting for a tab would be spent doing nothing
+        try:
+            await asyncio.wait_for(self.tab_slots.acquire(), wait_deadline.remaining())
+        except asyncio.TimeoutError:
+            return CheckResult(str(passport_code).strip(), TIMEOUT, strategy='cdp',
+                               error="Deadline passed while waiting for a free tab")
+        try:
+            try:
+                # The limiter may sleep, so wait for a token off the event loop
+                queue_wait = await asyncio.get_running_loop().run_in_executor(
+                    None, self.limiter.acquire, wait_deadline
+                )
+            except DeadlineExceeded as e:
+                return CheckResult(str(passport_code).strip(), TIMEOUT, error=str(e), strategy='cdp')
+            deadline = wait_deadline if deadline is not None else as_deadline(self.deadline_seconds)
+            result = await self._check(passport_code, deadline)
+        finally:
+            self.tab_slots.release()
+        result.queue_wait = round(queue_wait, 2)
+        return result
+
+    async def check_batch(self, codes):
+        """Check many codes in parallel tabs, yielding results as they arrive"""
+        try:
+            await self.clear_challenge()
+        except Exception as e:
+            logging.warning(f"Pre-clearing Cloudflare failed, tabs will handle it: {e}")
+        tasks = [asyncio.ensure_future(self.check(code)) for code in codes]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _check(self, passport_code, deadline):
+        passport_code = str(passport_code).strip()
+        started = time.monotonic()
+        tab = None
+        try:
+            tab = await Tab.open(self.conn, self.user_agent, self.page_load)
+            text = await asyncio.wait_for(self._run(tab, passport_code), deadline.remaining())
+            result = CheckResult(passport_code, classify_status(text), text=text or "", strategy='cdp')
+        except asyncio.TimeoutError as e:
+            # Either the deadline cancelled _run or a single DevTools call timed out
+            error = f"check exceeded the {deadline.seconds}s deadline" if deadline.expired() else str(e) or "DevTools call timed out"
+            logging.error(f"CDP check for {passport_code} failed: {error}")
+            result = CheckResult(passport_code, TIMEOUT if deadline.expired() else ERROR, error=error, strategy='cdp')
+        except Exception as e:
+            logging.error(f"CDP check for {passport_code} failed: {e}")
+            result = CheckResult(passport_code, ERROR, error=str(e), strategy='cdp')
+        finally:
+            if tab is not None:
+                await tab.close()
+        result.elapsed = round(time.monotonic() - started, 2)
+        logging.info(f"Check for {passport_code} finished: {result.status} via cdp in {result.elapsed}s")
+        return result
+
+    async def _run(self, tab, passport_code):
+        await tab.navigate(BASE_URL)
+        if not await self.wait_for_cloudflare(tab):
+            raise RuntimeError("Could not bypass Cloudflare or anti-bot protection")
+        await self.pause(2, 5)
+
+        point = await tab.find_and_focus(INPUT_SELECTORS, self.timeouts['search_input_wait'])
+        if not point:
+            raise RuntimeError("Could not find search input")
+        await self.pause(0.3, 0.8)
+        await tab.type_text(passport_code)
+        await self.pause(1, 2.5)
+
+        point = await tab.find_and_focus(BUTTON_SELECTORS, self.timeouts['search_button_wait'])
+        if not point:
+            raise RuntimeError("Could not find search button")
+        await tab.click(point['x'], point['y'])
+
+        await tab.wait_for(RESULT_READY_EXPRESSION, self.timeouts['result_wait'] + 15)
+        await self.pause(1, 3)
+        html = await tab.evaluate(RESULT_HTML_EXPRESSION)
+        return pc.parse_status_html(html) if html else None
+
+    def alive(self):
+        """True while Chrome is running and its DevTools connection is open"""
+        return (self.conn is not None and not self.conn.closed
+                and self.process is not None and self.process.returncode is None)
+
+    async def close(self):
+        if self.conn is not None and not self.conn.closed:
+            try:
+                await self.conn.send('Browser.close', timeout=5)
+            except Exception:
+                pass
+            await self.conn.close()
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+
+def find_chrome():
+    """Locate the Chrome executable the same way undetected_chromedriver does"""
+    import undetected_chromedriver as uc
+    return uc.find_chrome_executable()
+
+
+class BackgroundEngine:
+    """Runs an AsyncCheckEngine on its own event-loop thread.
+
+    Lets synchronous callers such as the Flask API keep one already-cleared
+    browser around and push batches of codes into it. If Chrome dies, the
+    next batch launches a new one.
+    """
+
+    def __init__(self, **engine_options):
+        self.engine_options = engine_options
+        self.engine = None
+        self.loop = None
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        with self.start_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name='cdp-engine', daemon=True)
+                self.thread.start()
+            elif self.engine is not None:
+                if self.engine.alive():
+                    return self
+                logging.warning("Chrome for the CDP engine is gone, relaunching it")
+                self._discard_engine()
+            engine = AsyncCheckEngine(**self.engine_options)
+            try:
+                asyncio.run_coroutine_threadsafe(engine.start(), self.loop).result()
+            except Exception:
+                self.engine = engine
+                self._discard_engine()
+                raise
+            self.engine = engine
+            return self
+
+    def _discard_engine(self):
+        """Kill what is left of the current browser and forget it"""
+        try:
+            asyncio.run_coroutine_threadsafe(self.engine.close(), self.loop).result(timeout=30)
+        except Exception as e:
+            logging.debug(f"Cleaning up the old CDP engine failed: {e}")
+        self.engine = None
+
+    def iter_batch(self, codes):
+        """Yield CheckResults in completion order as the tabs finish"""
+        self.start()
+        results = queue.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                async for result in self.engine.check_batch(codes):
+                    results.put(result)
+            finally:
+                results.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self.loop)
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+    def check(self, passport_code, deadline=None):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.engine.check(passport_code, deadline), self.loop).result()
+
+    def close(self):
+        if self.loop is None:
+            return
+        if self.engine is not None:
+            asyncio.run_coroutine_threadsafe(self.engine.close(), self.loop).result(timeout=30)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.engine = self.loop = self.thread = None
+
+
+async def check_codes(codes, **engine_options):
+    """Check several codes concurrently in tabs of one browser, in input order"""
+    async with AsyncCheckEngine(**engine_options) as engine:
+        by_code = {}
+        async for result in engine.check_batch(codes):
+            by_code[result.passport_code] = result
+        return [by_code[str(code).strip()] for code in codes]
+
+
+def run_check(passport_code, **engine_options):
+    """Synchronous helper for callers outside an event loop"""
+    return asyncio.run(check_codes([passport_code], **engine_options))[0]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    for result in asyncio.run(check_codes(sys.argv[1:])):
+        print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
@@ -0,0 +1,422 @@
+"""
+Shared passport check engine
+One check flow used by the CLI, GUI and API, with pluggable strategies for
+getting the status out of passport.mfa.gov.ua and a single result type
+"""
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+
+import passport_check as pc
+import rate_limiter
+import keystrokes
+from deadline import Deadline, DeadlineExceeded, as_deadline
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import (
+    TimeoutException, WebDriverException, InvalidSessionIdException, NoSuchWindowException
+)
+
+BASE_URL = "https://passport.mfa.gov.ua"
+
+DEFAULT_TIMEOUTS = {
+    "search_input_wait": 5,
+    "search_button_wait": 5,
+    "result_wait": 5,
+}
+
+INPUT_SELECTORS = [
+    'input[type="text"]',
+    'input[name="passport"]',
+    'input[name="number"]',
+    'input[placeholder*="passport"]',
+    'input[placeholder*="номер"]',
+    'input[placeholder*="сесії"]',
+    'input[class*="search"]',
+    '#sessionId',
+    '//input[@type="text"]',
+    '//input[contains(@class, "search")]',
+    '//input[contains(@placeholder, "passport")]',
+    '//input[not(@type="hidden")]',
+    'input',
+]
+
+BUTTON_SELECTORS = [
+    'button[type="submit"]',
+    'input[type="submit"]',
+    'button:not([type])',
+    '.search-button',
+    '.btn-primary',
+    '//button[@type="submit"]',
+    '//input[@type="submit"]',
+    '//button[contains(text(), "Search")]',
+    '//button[contains(text(), "Пошук")]',
+    'button',
+]
+
+# Text that means the site refused to show us the status
+UNAVAILABLE_SIGNALS = [
+    'temporarily unavailable',
+    'тимчасово недоступні',
+    'тимчасово недоступна',
+    'could not extract detailed passport status',
+]
+
+INVALID_SIGNALS = ['не знайдено', 'not found', 'невірний', 'incorrect', 'недійсний', 'invalid']
+# Full phrases: a bare "ready" would also match "not ready"
+VALID_SIGNALS = ['документ готовий', 'document ready', 'документ видано', 'document issued']
+PROCESSING_SIGNALS = [
+    'оброблено', 'processed', 'персоналізац', 'personalization', 'перевірку', 'verification',
+    'подано', 'submitted', 'заявку', 'application',
+]
+
+# Result statuses
+VALID = "VALID"
+PROCESSING = "PROCESSING"
+INVALID = "INVALID"
+UNKNOWN = "UNKNOWN"
+BLOCKED = "BLOCKED"
+ERROR = "ERROR"
+TIMEOUT = "TIMEOUT"
+
+
+@dataclass
+class CheckResult:
+    """Outcome of one passport check, shared by every front end"""
+    passport_code: str
+    status: str
+    text: str = ""
+    translated: str | None = None
+    strategy: str | None = None
+    error: str | None = None
+    elapsed: float = 0.0
+    queue_wait: float = 0.0
+    checked_at: str = field(default_factory=lambda: datetime.now().isoformat())
+
+    @property
+    def success(self):
+        return self.status not in (ERROR, BLOCKED, TIMEOUT)
+
+    @property
+    def message(self):
+        return self.text or self.error or ""
+
+    def to_dict(self):
+        data = asdict(self)
+        data['success'] = self.success
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        fields = {key: value for key, value in data.items() if key in cls.__dataclass_fields__}
+        return cls(**fields)
+
+
+def classify_status(text):
+    """Map scraped status text to one of the result statuses"""
+    lowered = (text or "").lower()
+    if not lowered.strip():
+        return UNKNOWN
+    if any(sig in lowered for sig in UNAVAILABLE_SIGNALS):
+        return BLOCKED
+    # Not-found pages also say "заявку"/"application", so they are checked first
+    if any(sig in lowered for sig in INVALID_SIGNALS):
+        return INVALID
+    if any(sig in lowered for sig in VALID_SIGNALS):
+        return VALID
+    if any(sig in lowered for sig in PROCESSING_SIGNALS):
+        return PROCESSING
+    return UNKNOWN
+
+
+def is_browser_failure(error):
+    """True if the browser session is gone and the driver must be relaunched"""
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException)):
+        return True
+    message = str(error).lower()
+    return isinstance(error, WebDriverException) and any(
+        sig in message for sig in ('chrome not reachable', 'disconnected', 'session deleted', 'no such window')
+    )
+
+
+def pause(min_seconds, max_seconds, deadline=None):
+    """Short humanization pause, cut short by the deadline"""
+    (deadline or Deadline()).sleep(random.uniform(min_seconds, max_seconds))
+
+
+PAGE_READY_SCRIPT = "return location.href.indexOf(arguments[0]) === 0 && !!document.body;"
+
+
+def open_site(driver, humanize=True, deadline=None):
+    """Load the site and get past Cloudflare"""
+    deadline = deadline or Deadline()
+    logging.info(f"Accessing URL: {BASE_URL}")
+    page_timeout = deadline.clamp(30, "page load")
+    driver.set_page_load_timeout(page_timeout)
+    try:
+        driver.get(BASE_URL)
+    except TimeoutException:
+        deadline.check("page load")
+        raise RuntimeError(f"Page did not load within {page_timeout:.0f} seconds.")
+
+    try:
+        # With the "none" strategy get() returns before the site's document exists
+        WebDriverWait(driver, deadline.clamp(30, "page load")).until(
+            lambda d: d.execute_script(PAGE_READY_SCRIPT, BASE_URL)
+        )
+    except TimeoutException:
+        deadline.check("page load")
+        raise RuntimeError("Page did not load within 30 seconds.")
+
+    if humanize:
+        driver.execute_script("""
+            var event = new MouseEvent('mousemove', {
+                clientX: Math.random() * window.innerWidth,
+                clientY: Math.random() * window.innerHeight
+            });
+            document.dispatchEvent(event);
+            window.scrollTo(0, Math.random() * 200);
+        """)
+
+    if not pc.wait_for_cloudflare(driver, None, deadline=deadline):
+        raise RuntimeError("Could not bypass Cloudflare or anti-bot protection")
+
+
+def type_code(element, passport_code, deadline=None):
+    """Type the code with a human-like rhythm, slower at the start"""
+    keystrokes.type_into(element, passport_code, keystrokes.NORMAL, deadline)
+
+
+class BrowserStrategy:
+    """Fill in the search form like a user and read the result table"""
+
+    name = "browser"
+
+    def __init__(self, humanize=True):
+        self.humanize = humanize
+
+    def run(self, driver, passport_code, timeouts, deadline):
+        open_site(driver, self.humanize, deadline)
+        self.before_form(driver, deadline)
+        self.submit(driver, passport_code, timeouts, deadline)
+        self.wait_for_result(driver, deadline)
+        return self.extract(driver, passport_code, timeouts, deadline)
+
+    def before_form(self, driver, deadline):
+        if not self.humanize:
+            pause(1, 2, deadline)
+            return
+        logging.info("Simulating detailed human browsing behavior...")
+        pause(8, 15, deadline)
+        driver.execute_script("""
+            window.scrollTo(0, 150);
+            setTimeout(() => window.scrollTo(0, 300), 800);
+            setTimeout(() => window.scrollTo(0, 100), 1600);
+            setTimeout(() => window.scrollTo(0, 0), 2400);
+            var elements = document.querySelectorAll('input, button, a');
+            if (elements.length > 0) {
+                var randomElement = elements[Math.floor(Math.random() * elements.length)];
+                randomElement.dispatchEvent(new MouseEvent('mouseover', {bubbles: true}));
+            }
+        """)
+        pause(4, 8, deadline)
+
+    def submit(self, driver, passport_code, timeouts, deadline):
+        search_input = pc.find_element_safely(
+            driver, INPUT_SELECTORS, timeouts["search_input_wait"], "search input", deadline
+        )
+        if not search_input:
+            raise RuntimeError("Could not find search input")
+
+        logging.info(f"Typing passport code: {passport_code}")
+        search_input.click()
+        pause(0.5, 1.2, deadline)
+        search_input.clear()
+        pause(0.3, 0.8, deadline)
+        self.type_code(search_input, passport_code, deadline)
+        pause(1, 2.5, deadline)
+
+        search_button = pc.find_element_safely(
+            driver, BUTTON_SELECTORS, timeouts["search_button_wait"], "search button", deadline
+        )
+        if not search_button:
+            raise RuntimeError("Could not find search button")
+
+        logging.info("Clicking search button...")
+        driver.execute_script("arguments[0].focus();", search_button)
+        pause(0.2, 0.5, deadline)
+        search_button.click()
+
+    def type_code(self, element, passport_code, deadline):
+        type_code(element, passport_code, deadline)
+
+    def wait_for_result(self, driver, deadline):
+        if not self.humanize:
+            pause(3, 6, deadline)
+            return
+        logging.info("Waiting for results (extended wait for dynamic content)...")
+        pause(10, 18, deadline)
+        driver.execute_script("""
+            window.scrollTo(0, document.body.scrollHeight);
+            setTimeout(() => window.scrollTo(0, 0), 1000);
+        """)
+        pause(5, 8, deadline)
+        if driver.execute_script("return document.readyState") != "complete":
+            logging.info("Page still loading, waiting longer...")
+            pause(5, 10, deadline)
+
+    def extract(self, driver, passport_code, timeouts, deadline):
+        return pc.extract_passport_status(driver, timeouts["result_wait"], deadline, passport_code)
+
+
+class AjaxStrategy:
+    """Call the site's status endpoint directly with the browser's cookies"""
+
+    name = "ajax"
+
+    def run(self, driver, passport_code, timeouts, deadline):
+        current = driver.current_url or ""
+        if BASE_URL not in current:
+            open_site(driver, humanize=False, deadline=deadline)
+        return pc.fetch_status_via_ajax(driver, passport_code, deadline)
+
+
+class StealthStrategy(BrowserStrategy):
+    """Browser strategy with the slower, more human pacing from enhanced_stealth"""
+
+    name = "stealth"
+
+    def __init__(self):
+        super().__init__(humanize=True)
+
+    def before_form(self, driver, deadline):
+        import enhanced_stealth
+        enhanced_stealth.simulate_page_reading(driver, deadline)
+
+    def type_code(self, element, passport_code, deadline):
+        import enhanced_stealth
+        enhanced_stealth.type_like_human(element, passport_code, deadline)
+
+    def wait_for_result(self, driver, deadline):
+        import enhanced_stealth
+        enhanced_stealth.wait_like_human(driver, deadline)
+
+    def extract(self, driver, passport_code, timeouts, deadline):
+        import enhanced_stealth
+        return enhanced_stealth.extract_status_ultra_careful(driver, deadline, passport_code)
+
+
+class CheckEngine:
+    """Runs passport checks through an ordered list of strategies.
+
+    Strategies are tried in order; the next one only runs if the previous one
+    was blocked or produced nothing. With keep_driver the browser is reused
+    between checks and relaunched after a WebDriver failure. Each check is
+    bounded by deadline_seconds (or the deadline passed to check()); when it
+    runs out the check stops wherever it is and returns a TIMEOUT result.
+    Every check takes a token from the rate limiter before it touches the site.
+    """
+
+    def __init__(self, strategies=None, driver_factory=None, keep_driver=False,
+                 timeouts=None, translate=False, deadline_seconds=None, limiter=None, page_load=None):
+        self.strategies = strategies or [BrowserStrategy(), AjaxStrategy()]
+        self.page_load = page_load
+        self.driver_factory = driver_factory or self._default_driver
+        self.keep_driver = keep_driver
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.translate = translate
+        self.deadline_seconds = deadline_seconds
+        self.limiter = limiter or rate_limiter.default_limiter()
+        self.driver = None
+        self.lock = threading.Lock()
+
+    def check(self, passport_code, deadline=None):
+        """Check one passport code and return a CheckResult"""
+        passport_code = str(passport_code).strip()
+        deadline = as_deadline(self.deadline_seconds if deadline is None else deadline)
+        started = time.monotonic()
+        remaining = deadline.remaining()
+        if self.lock.acquire(timeout=-1 if remaining is None else remaining):
+            try:
+                result = self._check(passport_code, deadline)
+            finally:
+                self.lock.release()
+        else:
+            result = CheckResult(passport_code, TIMEOUT, error="Deadline passed while waiting for the browser")
+        result.elapsed = round(time.monotonic() - started, 2)
+        logging.info(f"Check for {passport_code} finished: {result.status} via {result.strategy} in {result.elapsed}s")
+        return result
+
+    def _check(self, passport_code, deadline):
+        result = None
+        queue_wait = 0.0
+        try:
+            queue_wait = self.limiter.acquire(deadline)
+            for strategy in self.strategies:
+                deadline.check()
+                if self.driver is None:
+                    self.driver = self.driver_factory()
+                logging.info(f"Checking {passport_code} with {strategy.name} strategy")
+                try:
+                    text = strategy.run(self.driver, passport_code, self.timeouts, deadline)
+                except Exception as e:
+                    if isinstance(e, DeadlineExceeded) or is_browser_failure(e):
+                        raise
+                    logging.warning(f"{strategy.name} strategy failed: {e}")
+                    if result is None:
+                        result = CheckResult(passport_code, ERROR, error=str(e), strategy=strategy.name)
+                    continue
+
+                if text:
+                    result = CheckResult(passport_code, classify_status(text), text=text, strategy=strategy.name)
+                    if result.status != BLOCKED:
+                        break
+
+            if result is None:
+                result = CheckResult(passport_code, ERROR, error="No strategy produced a status")
+
+        except DeadlineExceeded as e:
+            # The page may be mid-navigation or mid-typing; don't reuse it
+            logging.warning(f"Check for {passport_code} timed out: {e}")
+            self.reset_driver()
+            result = CheckResult(passport_code, TIMEOUT, error=str(e))
+
+        except Exception as e:
+            # Browser launch failed or the session died mid-check
+            logging.error(f"Browser failure while checking {passport_code}: {e}")
+            self.reset_driver()
+            result = CheckResult(passport_code, ERROR, error=f"Browser failure: {e}")
+
+        finally:
+            if not self.keep_driver:
+                self.reset_driver()
+
+        if self.translate and result.text:
+            result.translated = pc.translate_ukrainian_status(result.text, deadline)
+        result.queue_wait = round(queue_wait, 2)
+        return result
+
+    def _default_driver(self):
+        return pc.setup_driver({'page_load': self.page_load})
+
+    def start(self):
+        """Launch the browser ahead of the first check"""
+        with self.lock:
+            if self.driver is None:
+                self.driver = self.driver_factory()
+
+    def reset_driver(self):
+        """Quit the current browser; the next check launches a new one"""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+                logging.debug("Driver cleanup completed")
+            except Exception as cleanup_error:
+                logging.debug(f"Driver cleanup error (suppressed): {cleanup_error}")
+            self.driver = None
+
+    def close(self):
+        with self.lock:
+            self.reset_driver()
@@ -0,0 +1,121 @@
+"""
+Circuit breaker over check outcomes
+When the site keeps answering with anti-bot pages or "тимчасово недоступні",
+the breaker opens and checks fail fast instead of spending a browser run.
+After a cooldown one probe check is let through (half-open); if it is still
+blocked the breaker reopens with a doubled cooldown.
+"""
+import time
+import random
+import logging
+import threading
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of running a check while the breaker is open"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Site is blocking checks; retry in {retry_after:.0f}s")
+
+
+def is_blocked_result(result):
+    """True if a CheckResult means the site refused us rather than a one-off failure"""
+    from check_engine import BLOCKED
+    if result.status == BLOCKED:
+        return True
+    error = (result.error or "").lower()
+    return "cloudflare" in error or "anti-bot" in error
+
+
+class CircuitBreaker:
+    """Tracks consecutive blocked checks and decides whether to run the next one"""
+
+    def __init__(self, failure_threshold=3, cooldown_seconds=60, max_cooldown_seconds=1800):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0.0
+        self.probe_in_flight = False
+        self.fast_failures = 0
+        self.lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until the next check would be let through, 0 if it would run now"""
+        with self.lock:
+            if self.state == OPEN:
+                return max(0.0, self.opened_until - time.monotonic())
+            return 0.0
+
+    def before_check(self):
+        """Admit a check or raise CircuitOpen.
+
+        Returns True if the check is the half-open probe; pass that back to
+        record() or cancel() so only the probe settles the half-open state.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                remaining = self.opened_until - time.monotonic()
+                if remaining > 0:
+                    self.fast_failures += 1
+                    raise CircuitOpen(remaining)
+                self.state = HALF_OPEN
+                logging.info("🔌 Circuit half-open: letting one probe check through")
+            if self.state == HALF_OPEN:
+                if self.probe_in_flight:
+                    self.fast_failures += 1
+                    raise CircuitOpen(self.cooldown_seconds)
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record(self, result, probe=False):
+        """Feed a check outcome back into the breaker"""
+        with self.lock:
+            if probe:
+                self.probe_in_flight = False
+            elif self.state != CLOSED:
+                # Admitted before the trip; the cooldown covers it and only the probe decides
+                return
+            if is_blocked_result(result):
+                self.failures += 1
+                if probe or self.failures >= self.failure_threshold:
+                    self._trip()
+            elif result.success:
+                if self.state != CLOSED:
+                    logging.info("🔌 Circuit closed: site is answering again")
+                self.state = CLOSED
+                self.failures = 0
+                self.trips = 0
+
+    def cancel(self, probe=False):
+        """A check admitted by before_check() ended without a result"""
+        if probe:
+            with self.lock:
+                self.probe_in_flight = False
+
+    def _trip(self):
+        self.trips += 1
+        cooldown = min(self.max_cooldown_seconds, self.cooldown_seconds * 2 ** (self.trips - 1))
+        cooldown *= random.uniform(0.9, 1.1)
+        self.state = OPEN
+        self.opened_until = time.monotonic() + cooldown
+        logging.warning(f"🔌 Circuit open for {cooldown:.0f}s after {self.failures} blocked check(s)")
+
+    def stats(self):
+        retry_after = self.retry_after()
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutiveBlocked": self.failures,
+                "trips": self.trips,
+                "retryAfter": round(retry_after),
+                "fastFailures": self.fast_failures,
+            }
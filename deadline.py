@@ -0,0 +1,57 @@
+"""
+Per-check deadline shared by every wait in the check pipeline
+Waits, sleeps and HTTP calls ask the deadline for their remaining budget so a
+whole check has a guaranteed upper bound
+"""
+import time
+
+# Used when config.json has no "check_deadline_seconds"
+DEFAULT_CHECK_SECONDS = 150
+
+
+class DeadlineExceeded(Exception):
+    """The check ran out of time"""
+
+
+class Deadline:
+    """A point in time by which a check must finish.
+
+    Deadline(None) never expires, so code can always take a deadline argument
+    without special-casing callers that don't set one.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left, or None if unbounded"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, what="check"):
+        """Raise DeadlineExceeded if the budget is used up"""
+        if self.expired():
+            raise DeadlineExceeded(f"{what} exceeded the {self.seconds}s deadline")
+
+    def clamp(self, seconds, what="check"):
+        """Limit a timeout to the remaining budget; raises if nothing is left"""
+        self.check(what)
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+    def sleep(self, seconds):
+        """Sleep, but never past the deadline; raises once it has passed"""
+        time.sleep(self.clamp(seconds, "sleep"))
+        self.check()
+
+
+def as_deadline(deadline):
+    """Accept a Deadline, a number of seconds or None"""
+    if isinstance(deadline, Deadline):
+        return deadline
+    return Deadline(deadline)
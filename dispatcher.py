@@ -0,0 +1,170 @@
+"""
+Admission control for browser checks in the API
+A bounded queue in front of the worker pool: at most `concurrency` checks run
+at once, and waiting checks are served by priority lane - interactive
+lookups first, then batch jobs, then scheduled monitoring - FIFO within a
+lane. Each lane has its own depth and wait limits; anything beyond them is
+turned away immediately so request threads and memory stay bounded when the
+browsers are saturated.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Priority lanes, highest first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+SCHEDULED = "scheduled"
+LANES = (INTERACTIVE, BATCH, SCHEDULED)
+
+# Latency samples kept per lane for the percentiles on /status
+LATENCY_SAMPLES = 200
+
+
+class QueueFull(Exception):
+    """The lane is at max depth; the request was not admitted"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Check queue is full; retry in {retry_after:.0f}s")
+
+
+class QueueTimeout(Exception):
+    """The request waited max_wait without reaching a browser"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"No browser became free in time; retry in {retry_after:.0f}s")
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+class Lane:
+    """Waiting tickets and latency counters of one priority class"""
+
+    def __init__(self, name, max_depth, max_wait):
+        self.name = name
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.waiting = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queue_waits = deque(maxlen=LATENCY_SAMPLES)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def status(self):
+        return {
+            "depth": len(self.waiting),
+            "maxDepth": self.max_depth,
+            "maxWait": self.max_wait,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timedOut": self.timed_out,
+            "queueWaitP50": percentile(self.queue_waits, 0.5),
+            "queueWaitP95": percentile(self.queue_waits, 0.95),
+            "latencyP50": percentile(self.latencies, 0.5),
+            "latencyP95": percentile(self.latencies, 0.95),
+        }
+
+
+class CheckDispatcher:
+    """Runs checks through run(passport_code) by lane priority with bounded waiting.
+
+    A free browser always goes to the oldest waiting interactive request, so
+    a "check now" never waits behind queued batch or scheduled work; checks
+    already running are not interrupted.
+    """
+
+    def __init__(self, run, concurrency=2, max_depth=20, max_wait=60, lanes=None):
+        self.run = run
+        self.concurrency = concurrency
+        self.condition = threading.Condition()
+        self.lanes = {}
+        for name in LANES:
+            lane_config = (lanes or {}).get(name, {})
+            self.lanes[name] = Lane(
+                name,
+                lane_config.get('max_depth', max_depth),
+                lane_config.get('max_wait_seconds', max_wait)
+            )
+        self.active = 0
+        self.average_service = 30.0
+
+    def retry_after(self, lane):
+        """Rough time until a new request in lane could start, from the recent check duration"""
+        ahead = self.active
+        for name in LANES:
+            ahead += len(self.lanes[name].waiting)
+            if name == lane.name:
+                break
+        return max(1.0, self.average_service * ahead / self.concurrency)
+
+    def next_ticket(self):
+        for name in LANES:
+            if self.lanes[name].waiting:
+                return self.lanes[name].waiting[0]
+        return None
+
+    @contextmanager
+    def admit(self, label, lane=INTERACTIVE):
+        """Wait for a free slot and hold it while the block runs"""
+        lane = self.lanes[lane]
+        ticket = object()
+        with self.condition:
+            if len(lane.waiting) >= lane.max_depth:
+                lane.rejected += 1
+                logging.warning(f"⚠️ {lane.name} queue full ({lane.max_depth} waiting), turning away {label}")
+                raise QueueFull(self.retry_after(lane))
+            lane.waiting.append(ticket)
+            queued_at = time.monotonic()
+            expires_at = queued_at + lane.max_wait
+            while self.active >= self.concurrency or self.next_ticket() is not ticket:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    lane.waiting.remove(ticket)
+                    lane.timed_out += 1
+                    logging.warning(f"⚠️ {label} waited {lane.max_wait}s in the {lane.name} queue, giving up")
+                    self.condition.notify_all()
+                    raise QueueTimeout(self.retry_after(lane))
+                self.condition.wait(remaining)
+            lane.waiting.popleft()
+            self.active += 1
+            lane.admitted += 1
+            lane.queue_waits.append(time.monotonic() - queued_at)
+            # The next in line may also fit if there is more than one free slot
+            self.condition.notify_all()
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                lane.latencies.append(time.monotonic() - queued_at)
+                self.condition.notify_all()
+
+    def submit(self, passport_code, lane=INTERACTIVE):
+        """Wait for a free slot, run the check and return its result"""
+        with self.admit(passport_code, lane):
+            started = time.monotonic()
+            try:
+                return self.run(passport_code)
+            finally:
+                with self.condition:
+                    self.average_service = 0.8 * self.average_service + 0.2 * (time.monotonic() - started)
+
+    def status(self):
+        with self.condition:
+            return {
+                "depth": sum(len(lane.waiting) for lane in self.lanes.values()),
+                "active": self.active,
+                "concurrency": self.concurrency,
+                "lanes": {name: lane.status() for name, lane in self.lanes.items()},
+            }
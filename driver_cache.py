@@ -0,0 +1,147 @@
+"""
+Chromedriver cache for undetected_chromedriver
+Patches the chromedriver binary once per Chrome major version and lets every
+launch reuse it instead of re-downloading and re-patching on each uc.Chrome()
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import logging
+import subprocess
+
+import undetected_chromedriver as uc
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.passport_checker', 'chromedriver')
+EXE_SUFFIX = '.exe' if sys.platform.startswith('win') else ''
+
+# Paths already validated by this process, keyed by Chrome major version
+_prepared = {}
+
+
+class FileLock:
+    """Minimal cross-process exclusive lock on a lock file"""
+
+    def __init__(self, path, timeout=120):
+        self.path = path
+        self.timeout = timeout
+        self.handle = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.handle = open(self.path, 'a+')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if sys.platform.startswith('win'):
+                    import msvcrt
+                    self.handle.seek(0)
+                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.handle.close()
+                    raise TimeoutError(f"Timed out waiting for lock {self.path}")
+                time.sleep(0.1)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if sys.platform.startswith('win'):
+                import msvcrt
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.handle.close()
+        return False
+
+
+def detect_chrome_major():
+    """Return the installed Chrome major version, or None if it can't be found"""
+    if sys.platform.startswith('win'):
+        try:
+            import winreg
+            for hive in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+                try:
+                    with winreg.OpenKey(hive, r'Software\Google\Chrome\BLBeacon') as key:
+                        version, _ = winreg.QueryValueEx(key, 'version')
+                        return int(version.split('.')[0])
+                except OSError:
+                    continue
+        except Exception as e:
+            logging.debug(f"Could not read Chrome version from registry: {e}")
+        return None
+
+    try:
+        chrome = uc.find_chrome_executable()
+        if not chrome:
+            return None
+        output = subprocess.run([chrome, '--version'], capture_output=True, text=True, timeout=10).stdout
+        match = re.search(r'(\d+)\.\d+\.\d+', output)
+        return int(match.group(1)) if match else None
+    except Exception as e:
+        logging.debug(f"Could not detect Chrome version: {e}")
+        return None
+
+
+def cached_driver_path(version_main):
+    """Path of the cached patched chromedriver for a Chrome major version"""
+    return os.path.join(CACHE_DIR, f"chromedriver_{version_main}{EXE_SUFFIX}")
+
+
+def prepare_driver(version_main=None):
+    """Make sure a patched chromedriver for this Chrome version is cached.
+
+    Downloads and patches at most once per Chrome major version; concurrent
+    processes serialize on a file lock so only one of them does the work.
+    Returns (driver_path, version_main).
+    """
+    version_main = version_main or detect_chrome_major()
+    if not version_main:
+        raise RuntimeError("Could not detect installed Chrome version")
+
+    target = cached_driver_path(version_main)
+    if _prepared.get(version_main) == target and os.path.exists(target):
+        return target, version_main
+
+    with FileLock(os.path.join(CACHE_DIR, 'prepare.lock')):
+        if os.path.exists(target) and uc.Patcher(executable_path=target).is_binary_patched():
+            logging.debug(f"Reusing cached chromedriver: {target}")
+        else:
+            logging.info(f"Preparing patched chromedriver for Chrome {version_main}...")
+            started = time.monotonic()
+            patcher = uc.Patcher(version_main=version_main)
+            patcher.auto()
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            shutil.copy2(patcher.executable_path, tmp_path)
+            os.replace(tmp_path, target)
+            logging.info(f"Cached chromedriver at {target} ({time.monotonic() - started:.1f}s)")
+
+    _prepared[version_main] = target
+    return target, version_main
+
+
+def driver_launch_kwargs():
+    """Keyword arguments for uc.Chrome() that point it at the cached driver.
+
+    Falls back to undetected_chromedriver's own download/patch logic if the
+    cache can't be prepared, so a launch never fails because of the cache.
+    """
+    try:
+        driver_path, version_main = prepare_driver()
+        return {'driver_executable_path': driver_path, 'version_main': version_main}
+    except Exception as e:
+        logging.warning(f"Chromedriver cache unavailable, letting undetected_chromedriver patch: {e}")
+        return {}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    path, version = prepare_driver()
+    print(f"Patched chromedriver for Chrome {version}: {path}")
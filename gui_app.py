@@ -8,8 +8,7 @@ from tkinter import ttk, messagebox, filedialog
 
 import webbrowser
 
-# Reuse existing logic from passport_check.py
-import passport_check as pc
+from deadline import DEFAULT_CHECK_SECONDS
 
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,6 +18,35 @@ LOGS_DIR = os.path.join(SCRIPT_DIR, 'logs')
 LAST_LOG_FILE = os.path.join(SCRIPT_DIR, 'last.log')
 
 
+_logging_ready = False
+
+
+def load_checker():
+    """Import the check engine on first use.
+
+    It pulls in selenium, undetected_chromedriver, bs4 and requests and sets up
+    file logging, none of which is needed to show the window.
+    """
+    global _logging_ready
+    import check_engine
+    if not _logging_ready:
+        check_engine.pc.setup_logging()
+        _logging_ready = True
+    return check_engine
+
+
+_store = None
+
+
+def load_store():
+    """Open the persistent schedule/result store on first use"""
+    global _store
+    if _store is None:
+        from state_store import StateStore
+        _store = StateStore(load_config().get('state_db'))
+    return _store
+
+
 def load_default_config() -> dict:
     try:
         with open(DEFAULT_CONFIG_PATH, 'r', encoding='utf-8') as f:
@@ -96,14 +124,16 @@ def run_single_check(passport_code: str, timeouts: dict, send_email: bool) -> di
 
     Returns: {
       'ok': bool,
+      'status': str,             # check status (VALID, PROCESSING, ...)
       'message': str,            # user-facing status text (english)
       'changed': bool,           # compared to last.log
       'log_file': Optional[str], # path to saved log file
     }
     """
     os.makedirs(LOGS_DIR, exist_ok=True)
+    ce = load_checker()
+    pc = ce.pc
 
-    driver = None
     result = {
         'ok': False,
         'message': '',
@@ -111,106 +141,51 @@ def run_single_check(passport_code: str, timeouts: dict, send_email: bool) -> di
         'log_file': None,
     }
 
-    try:
-        # Update config.json to keep system consistent with CLI script
-        cfg = load_config()
-        cfg['passport_code'] = passport_code or cfg.get('passport_code', '')
-        cfg.setdefault('timeouts', {})
-        cfg['timeouts']['search_input_wait'] = int(timeouts.get('search_input_wait', 5))
-        cfg['timeouts']['search_button_wait'] = int(timeouts.get('search_button_wait', 5))
-        cfg['timeouts']['result_wait'] = int(timeouts.get('result_wait', 5))
-        save_config(cfg)
-
-        driver = pc.setup_driver()
-        url = "https://passport.mfa.gov.ua"
-        driver.get(url)
-        pc.wait_with_random_delay(8, 12)
-
-        if not pc.wait_for_cloudflare(driver, None):
-            raise RuntimeError("Could not bypass Cloudflare protection")
-
-        # Find search input
-        input_selectors = [
-            'input[type="text"]',
-            'input[name="passport"]',
-            'input[class*="search"]',
-            '//input[@type="text"]',
-            '//input[contains(@class, "search")]',
-            '//input[not(@type="hidden")]',
-            'input',
-        ]
-        search_input = pc.find_element_safely(
-            driver,
-            input_selectors,
-            int(cfg['timeouts'].get('search_input_wait', 5)),
-            "search input",
-        )
-        if not search_input:
-            raise RuntimeError("Could not find search input")
-
-        # Type code
-        search_input.clear()
-        for ch in str(passport_code):
-            search_input.send_keys(ch)
-            pc.wait_with_random_delay(1, 1)  # Use integer values
-
-        # Find and click search button
-        button_selectors = [
-            'button[type="submit"]',
-            'input[type="submit"]',
-            'button:not([type])',
-            '.search-button',
-            '//button[@type="submit"]',
-            '//input[@type="submit"]',
-            '//button[contains(text(), "Search")]',
-            '//button[contains(text(), "Пошук")]',
-            'button',
-        ]
-        search_button = pc.find_element_safely(
-            driver,
-            button_selectors,
-            int(cfg['timeouts'].get('search_button_wait', 5)),
-            "search button",
-        )
-        if not search_button:
-            raise RuntimeError("Could not find search button")
-
-        search_button.click()
-        pc.wait_with_random_delay(3, 7)
-
-        log_text_uk = pc.extract_passport_status(driver, int(cfg['timeouts'].get('result_wait', 5)))
-        if not log_text_uk:
-            raise RuntimeError("Could not extract passport status")
-
-        log_text_en = pc.translate_ukrainian_status(log_text_uk)
-
-        # change detection and file save similar to CLI flow
-        changed = pc.compare_with_last_log(log_text_en, SCRIPT_DIR)
-        log_filename = os.path.join(LOGS_DIR, f"passport_log_{time.strftime('%Y%m%d_%H%M%S')}.txt")
-        with open(log_filename, 'w', encoding='utf-8') as f:
-            f.write(log_text_en)
+    # Update config.json to keep system consistent with CLI script
+    cfg = load_config()
+    cfg['passport_code'] = passport_code or cfg.get('passport_code', '')
+    cfg.setdefault('timeouts', {})
+    cfg['timeouts']['search_input_wait'] = int(timeouts.get('search_input_wait', 5))
+    cfg['timeouts']['search_button_wait'] = int(timeouts.get('search_button_wait', 5))
+    cfg['timeouts']['result_wait'] = int(timeouts.get('result_wait', 5))
+    save_config(cfg)
+
+    import rate_limiter
+    import artifact_store
+    rate_limiter.configure(cfg.get('rate_limit'))
+    artifact_store.configure(cfg.get('artifacts'))
+    engine = ce.CheckEngine(timeouts=cfg['timeouts'], translate=True,
+                            deadline_seconds=cfg.get('check_deadline_seconds', DEFAULT_CHECK_SECONDS),
+                            page_load=cfg.get('page_load'))
+    check = engine.check(passport_code)
+    if check.status in (ce.ERROR, ce.TIMEOUT):
+        raise RuntimeError(check.error)
+    if check.success:
+        load_store().save_result(check)
+
+    log_text_en = check.translated or check.text
+
+    # change detection and file save similar to CLI flow
+    changed = pc.compare_with_last_log(log_text_en, SCRIPT_DIR)
+    log_filename = os.path.join(LOGS_DIR, f"passport_log_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+    with open(log_filename, 'w', encoding='utf-8') as f:
+        f.write(log_text_en)
+
+    if send_email:
+        try:
+            pc.send_email(log_text_en, CONFIG_PATH, changed)
+        except Exception:
+            # Non-fatal for GUI single run
+            pass
 
-        if send_email:
-            try:
-                pc.send_email(log_text_en, CONFIG_PATH, changed)
-            except Exception:
-                # Non-fatal for GUI single run
-                pass
-
-        result.update({
-            'ok': True,
-            'message': log_text_en,
-            'changed': changed,
-            'log_file': log_filename,
-        })
-        return result
-
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception:
-                pass
+    result.update({
+        'ok': True,
+        'status': check.status,
+        'message': log_text_en,
+        'changed': changed,
+        'log_file': log_filename,
+    })
+    return result
 
 
 class Tooltip:
@@ -578,28 +553,46 @@ class PassportGUI:
 
         self.stop_event.clear()
 
+        # Pick up the saved schedule so a restart neither resets it nor fires early
+        store = load_store()
+        schedule = store.resume_schedule('gui', passport, interval, self.cfg.get('resume_spread_seconds', 60))
+
         def loop():
+            nonlocal schedule
             self.append_output('=== Auto-check started ===')
+            if schedule['check_count']:
+                next_str = time.strftime('%H:%M:%S', time.localtime(schedule['next_due']))
+                self.append_output(f"Resuming saved schedule ({schedule['check_count']} checks so far), next at {next_str}")
             while not self.stop_event.is_set():
+                # wait with small steps to allow responsive stop
+                total = int(schedule['next_due'] - time.time())
+                while total > 0 and not self.stop_event.is_set():
+                    self.set_status(f'Next run in {total}s')
+                    step = min(5, total)
+                    time.sleep(step)
+                    total -= step
+                if self.stop_event.is_set():
+                    break
+
                 self.set_status('Auto-check: running')
+                job_id = store.start_job('gui', passport)
+                status, error = None, None
                 try:
                     res = run_single_check(passport, to, self.var_send_email.get())
+                    status = res.get('status')
                     if res['ok']:
                         self.append_output(res['message'])
                         suffix = 'CHANGED' if res['changed'] else 'unchanged'
                         self.append_output(f"Saved log: {res['log_file']} (status {suffix})")
                     else:
+                        error = 'Check failed'
                         self.append_output('Check failed')
                 except Exception as e:
+                    error = str(e)
                     self.append_output(f"Error: {e}\n{traceback.format_exc()}")
-
-                # wait with small steps to allow responsive stop
-                total = interval
-                while total > 0 and not self.stop_event.is_set():
-                    step = min(5, total)
-                    time.sleep(step)
-                    total -= step
-                    self.set_status(f'Next run in {total}s')
+                finally:
+                    store.finish_job(job_id, status, error)
+                schedule = store.schedule_next('gui', time.time() + interval)
 
             self.set_status('Stopped')
             self.append_output('=== Auto-check stopped ===')
@@ -609,6 +602,15 @@ class PassportGUI:
 
     def on_stop_auto(self):
         self.stop_event.set()
+        load_store().set_schedule_active('gui', False)
+
+    def resume_auto(self):
+        """Restart auto-check if it was running when the app last closed"""
+        schedule = load_store().get_schedule('gui')
+        if schedule and schedule['active']:
+            self.var_passport.set(schedule['passport_code'])
+            self.var_interval.set(str(schedule['interval_seconds']))
+            self.on_start_auto()
 
     def on_open_logs(self):
         os.makedirs(LOGS_DIR, exist_ok=True)
@@ -649,6 +651,10 @@ def main():
         y = (root.winfo_screenheight() // 2) - (height // 2)
         root.geometry(f'{width}x{height}+{x}+{y}')
         
+        # Warm up the checker in the background once the window is visible
+        root.after(500, lambda: threading.Thread(target=load_checker, daemon=True).start())
+        root.after(1000, app.resume_auto)
+        
         print("GUI started successfully. Close the window to exit.")
         root.mainloop()
         print("GUI closed.")
@@ -0,0 +1,52 @@
+"""
+Import-time budget check for the GUI and API entry points
+Imports each entry module in a fresh interpreter, measures how long it takes
+and makes sure the browser stack is not pulled in at import time.
+
+Usage: python import_budget.py
+"""
+import sys
+import json
+import subprocess
+
+# Seconds allowed for `import <module>` in a fresh interpreter
+BUDGETS = {
+    'gui_app': 0.25,
+    'api_server': 0.5,
+}
+
+# Modules that must only be imported when a check actually runs
+HEAVY_MODULES = ['selenium', 'undetected_chromedriver', 'bs4', 'requests', 'smtplib', 'passport_check', 'check_engine']
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module):
+    """Return (seconds, heavy modules loaded) for importing module"""
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    data = json.loads(output.strip().splitlines()[-1])
+    return data['elapsed'], data['loaded']
+
+
+def main():
+    ok = True
+    for module, budget in BUDGETS.items():
+        elapsed, loaded = measure(module)
+        within = elapsed <= budget and not loaded
+        ok = ok and within
+        mark = "✅" if within else "❌"
+        print(f"{mark} {module}: {elapsed * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+        if loaded:
+            print(f"   heavy modules imported eagerly: {', '.join(loaded)}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
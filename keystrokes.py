@@ -0,0 +1,86 @@
+"""
+Human-like typing sent as one batch instead of one WebDriver call per key
+The keystroke timeline (which key, how long to wait before pressing it and
+how long to hold it) is generated locally. Selenium drivers replay the whole
+timeline in a single W3C Actions request, which chromedriver turns into
+trusted Input.dispatchKeyEvent calls; the CDP engine paces the same timeline
+against absolute offsets so round trips never stretch the rhythm.
+"""
+import random
+import logging
+
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import WebDriverException
+
+from deadline import Deadline, DeadlineExceeded
+
+# Typing styles
+NORMAL = "normal"
+CAREFUL = "careful"
+
+
+def keystroke_timeline(text, style=NORMAL):
+    """List of (char, delay, hold): wait delay seconds, then press char for hold seconds"""
+    timeline = []
+    gap = 0.0
+    for i, char in enumerate(text):
+        delay = gap
+        if style == CAREFUL:
+            # Thinking pauses at the start, mid-sequence and before the last digit
+            if i == 0:
+                delay += random.uniform(0.5, 1.2)
+            elif i == 3:
+                delay += random.uniform(0.3, 0.7)
+            elif i == len(text) - 1:
+                delay += random.uniform(0.2, 0.5)
+            if i < 2:
+                gap = random.uniform(0.15, 0.35)
+            elif i < 5:
+                gap = random.uniform(0.08, 0.20)
+            else:
+                gap = random.uniform(0.10, 0.25)
+        else:
+            # Slower at the start
+            gap = random.uniform(0.15, 0.4) if i < 3 else random.uniform(0.08, 0.25)
+        timeline.append((char, delay, random.uniform(0.04, 0.11)))
+    return timeline
+
+
+def timeline_duration(timeline):
+    return sum(delay + hold for _, delay, hold in timeline)
+
+
+def type_into(element, text, style=NORMAL, deadline=None):
+    """Type text into the focused element with one Actions request.
+
+    Falls back to a single send_keys call if the driver rejects the actions.
+    """
+    deadline = deadline or Deadline()
+    timeline = keystroke_timeline(text, style)
+    duration = timeline_duration(timeline)
+    remaining = deadline.remaining()
+    if remaining is not None and duration > remaining:
+        raise DeadlineExceeded(f"typing needs {duration:.1f}s but only {remaining:.1f}s are left")
+
+    actions = ActionChains(element.parent)
+    for char, delay, hold in timeline:
+        if delay:
+            actions.pause(delay)
+        actions.key_down(char).pause(hold).key_up(char)
+    try:
+        actions.perform()
+    except WebDriverException as e:
+        logging.warning(f"Batched typing failed ({e}), sending the code at once")
+        element.clear()
+        element.send_keys(text)
+    deadline.check("typing")
+
+
+def cdp_key(char):
+    """Input.dispatchKeyEvent parameters for a keyDown of char"""
+    key = {'key': char, 'text': char, 'unmodifiedText': char}
+    if char.isdigit():
+        key.update({'code': f'Digit{char}', 'windowsVirtualKeyCode': ord(char)})
+    elif char.isalpha() and char.isascii():
+        key.update({'code': f'Key{char.upper()}', 'windowsVirtualKeyCode': ord(char.upper())})
+    return key
@@ -0,0 +1,118 @@
+"""
+Parser benchmark over the HTML pages the checker saves for debugging
+Times status extraction on every debug_page and ajax_status page in the
+artifact store (and any loose logs/*.html left from before it) with each
+available parser, both on the whole page and restricted to the
+#statusResultId container. Checks that all variants extract the same status
+and appends the totals to logs/parser_benchmark.jsonl so parser speed can be
+tracked over time.
+
+Usage: python parser_benchmark.py [repeats]
+"""
+import os
+import sys
+import glob
+import json
+import time
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+import artifact_store
+import passport_check as pc
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+CORPUS_KINDS = ['debug_page', 'ajax_status']
+CORPUS_PATTERNS = [f'{kind}_*.html' for kind in CORPUS_KINDS]
+RESULTS_FILE = os.path.join(LOGS_DIR, 'parser_benchmark.jsonl')
+
+
+def available_parsers():
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        print("ℹ️  lxml not installed, benchmarking html.parser only")
+    return parsers
+
+
+def parse_full(html, parser):
+    """The old path: a tree for the whole page, then look for the container"""
+    soup = BeautifulSoup(html, parser)
+    container = soup.find(id=pc.STATUS_CONTAINER_ID) or soup
+    return container.get_text('\n', strip=True)
+
+
+def parse_targeted(html, parser):
+    """The current path: only the container subtree is built"""
+    container = pc.status_container(html, parser) or BeautifulSoup(html, parser)
+    return container.get_text('\n', strip=True)
+
+
+def load_corpus():
+    files = []
+    for pattern in CORPUS_PATTERNS:
+        files.extend(sorted(glob.glob(os.path.join(LOGS_DIR, pattern))))
+    corpus = []
+    for path in files:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            corpus.append((os.path.basename(path), f.read()))
+    for digest, kind, html in artifact_store.default_store().pages(CORPUS_KINDS):
+        corpus.append((f"{kind}:{digest[:12]}", html))
+    return corpus
+
+
+def run(corpus, repeats):
+    """Return {case: seconds for one pass over the corpus} and the files whose output differs"""
+    timings = {}
+    mismatches = set()
+    for parser in available_parsers():
+        for mode, parse in (('full', parse_full), ('targeted', parse_targeted)):
+            case = f"{parser}/{mode}"
+            best = None
+            for _ in range(repeats):
+                started = time.perf_counter()
+                for name, html in corpus:
+                    parse(html, parser)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[case] = best
+            for name, html in corpus:
+                if parse(html, parser) != parse_full(html, 'html.parser'):
+                    mismatches.add(name)
+    return timings, mismatches
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    corpus = load_corpus()
+    if not corpus:
+        print(f"❌ No saved {' or '.join(CORPUS_KINDS)} pages in the artifact store or {LOGS_DIR}")
+        return False
+
+    size = sum(len(html) for _, html in corpus)
+    print(f"📄 {len(corpus)} pages, {size / 1024:.0f} KB, best of {repeats}")
+    timings, mismatches = run(corpus, repeats)
+    baseline = timings['html.parser/full']
+    for case, elapsed in timings.items():
+        print(f"⏱️  {case:22} {elapsed * 1000:8.1f} ms  {baseline / elapsed:5.1f}x")
+    for name in sorted(mismatches):
+        print(f"⚠️  {name}: extracted text differs between parsers")
+
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'timestamp': datetime.now().isoformat(),
+            'pages': len(corpus),
+            'bytes': size,
+            'default_parser': pc.HTML_PARSER,
+            'milliseconds': {case: round(elapsed * 1000, 2) for case, elapsed in timings.items()},
+            'mismatches': sorted(mismatches),
+        }) + '\n')
+    print(f"💾 Results appended to {RESULTS_FILE}")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -4,11 +4,11 @@ import os
 from datetime import datetime
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 import random
 import logging
-from bs4 import BeautifulSoup  # Add this import
+from bs4 import BeautifulSoup, SoupStrainer
 import json
 import requests  # Add at top for Google Translate API
 import smtplib
@@ -16,6 +16,11 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import threading
 import hashlib
+import fnmatch
+import driver_cache
+import artifact_store
+from deadline import Deadline, DeadlineExceeded, DEFAULT_CHECK_SECONDS
+from passport_codes import normalize_code, validate_code
 
 # Setup enhanced logging with rotation
 from logging.handlers import RotatingFileHandler
@@ -57,9 +62,6 @@ def setup_logging():
     
     return logger
 
-# Initialize logging
-logger = setup_logging()
-
 class ConfigMonitor:
     """Monitor configuration file for changes and reload settings automatically"""
     
@@ -185,48 +187,107 @@ def start_config_monitor(config_path):
     
     return config_monitor
 
+# Stealth patches injected before any page script runs
+EARLY_STEALTH_SCRIPT = """
+// 1) navigator.webdriver -> undefined
+Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
+
+// 2) window.chrome stub
+if (!window.chrome) {
+  window.chrome = { runtime: {} };
+} else if (!window.chrome.runtime) {
+  window.chrome.runtime = {};
+}
+
+// 3) Permissions: reflect Notification state instead of always granted
+const _origPerm = navigator.permissions && navigator.permissions.query;
+if (_origPerm) {
+  navigator.permissions.query = (parameters) => {
+    if (parameters && parameters.name === 'notifications') {
+      return Promise.resolve({ state: Notification.permission });
+    }
+    return _origPerm(parameters);
+  };
+}
+"""
+
+PREFERRED_LANGUAGE = 'uk-UA,uk;q=0.9,en-US;q=0.8,en;q=0.7'
+
+# Navigation settings; the "page_load" section of config.json overrides them.
+# "eager" returns from driver.get() at DOMContentLoaded instead of waiting for
+# every image, font and analytics script to finish.
+PAGE_LOAD_DEFAULTS = {
+    "strategy": "eager",
+    "block_third_party": True,
+    "blocked_urls": [],
+}
+
+PAGE_LOAD_STRATEGIES = ('normal', 'eager', 'none')
+
+# Analytics, ads and web fonts the status form does not need
+THIRD_PARTY_BLOCKLIST = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*googlesyndication.com*",
+    "*connect.facebook.net*",
+    "*facebook.com/tr*",
+    "*mc.yandex.ru*",
+    "*hotjar.com*",
+    "*fonts.googleapis.com*",
+    "*fonts.gstatic.com*",
+]
+
+# Requests that must never be blocked, or the site and the Cloudflare challenge break
+NEVER_BLOCK = [
+    "https://passport.mfa.gov.ua/",
+    "https://passport.mfa.gov.ua/Home/CurrentSessionStatus",
+    "https://passport.mfa.gov.ua/cdn-cgi/challenge-platform/h/b/orchestrate/chl_page/v1",
+    "https://challenges.cloudflare.com/turnstile/v0/api.js",
+    "https://challenges.cloudflare.com/cdn-cgi/challenge-platform/h/g/orchestrate/chl_page/v1",
+]
+
+
+def page_load_settings(config=None):
+    """Merge the page_load section of config over the defaults"""
+    settings = {**PAGE_LOAD_DEFAULTS, **((config or {}).get('page_load') or {})}
+    if settings['strategy'] not in PAGE_LOAD_STRATEGIES:
+        logging.warning(f"Unknown page load strategy {settings['strategy']!r}, using 'normal'")
+        settings['strategy'] = 'normal'
+    return settings
+
+
+def blocked_url_patterns(settings):
+    """Network.setBlockedURLs patterns, without any that would catch Cloudflare or the site"""
+    patterns = list(THIRD_PARTY_BLOCKLIST) if settings.get('block_third_party') else []
+    patterns += settings.get('blocked_urls') or []
+    allowed = []
+    for pattern in patterns:
+        if any(fnmatch.fnmatchcase(url, pattern) for url in NEVER_BLOCK):
+            logging.warning(f"Not blocking {pattern}: it matches Cloudflare or the site itself")
+        else:
+            allowed.append(pattern)
+    return allowed
+
+
 def setup_driver(config: dict | None = None):
     """Setup Chrome driver with minimized fingerprint and stability."""
     logging.info("Setting up Chrome driver...")
+    page_load = page_load_settings(config)
 
     try:
         options = uc.ChromeOptions()
+        options.page_load_strategy = page_load['strategy']
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--start-maximized')
         options.add_argument('--lang=uk-UA')
         
-        # Add stealth options from the original _inject_stealth helper
-        # to make this single attempt more robust.
-        early_script = """
-        // 1) navigator.webdriver -> undefined
-        Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-
-        // 2) window.chrome stub
-        if (!window.chrome) {
-          window.chrome = { runtime: {} };
-        } else if (!window.chrome.runtime) {
-          window.chrome.runtime = {};
-        }
-
-        // 3) Permissions: reflect Notification state instead of always granted
-        const _origPerm = navigator.permissions && navigator.permissions.query;
-        if (_origPerm) {
-          navigator.permissions.query = (parameters) => {
-            if (parameters && parameters.name === 'notifications') {
-              return Promise.resolve({ state: Notification.permission });
-            }
-            return _origPerm(parameters);
-          };
-        }
-        """
-        
-        driver = uc.Chrome(options=options)
+        driver = uc.Chrome(options=options, **driver_cache.driver_launch_kwargs())
         
         # Apply stealth settings
-        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': early_script})
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': EARLY_STEALTH_SCRIPT})
         
-        preferred_language = 'uk-UA,uk;q=0.9,en-US;q=0.8,en;q=0.7'
         try:
             ua = driver.execute_script("return navigator.userAgent")
         except Exception:
@@ -236,22 +297,31 @@ def setup_driver(config: dict | None = None):
             if ua:
                 driver.execute_cdp_cmd('Network.setUserAgentOverride', {
                     'userAgent': ua.replace('HeadlessChrome', 'Chrome'), # Make it look less like a bot
-                    'acceptLanguage': preferred_language,
+                    'acceptLanguage': PREFERRED_LANGUAGE,
                     'platform': 'Windows'
                 })
         except Exception:
             pass
 
-        logging.info("Chrome driver setup successful.")
+        blocked = blocked_url_patterns(page_load)
+        if blocked:
+            try:
+                driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked})
+                logging.info(f"🚫 Blocking {len(blocked)} third-party URL patterns")
+            except Exception as e:
+                logging.warning(f"Could not set the URL blocklist: {e}")
+
+        logging.info(f"Chrome driver setup successful (page load strategy: {page_load['strategy']}).")
         return driver
     except Exception as e:
         logging.error(f"Chrome driver setup failed: {e}")
         raise RuntimeError(f"Chrome driver setup failed: {e}")
 
 
-def wait_with_random_delay(min_seconds=2.0, max_seconds=5.0):
+def wait_with_random_delay(min_seconds=2.0, max_seconds=5.0, deadline=None):
     """Wait with random delay and progress indicator for longer waits"""
-    delay = random.uniform(min_seconds, max_seconds)
+    deadline = deadline or Deadline()
+    delay = deadline.clamp(random.uniform(min_seconds, max_seconds), "wait")
     if delay > 5:
         print(f"Waiting {delay:.1f} seconds...")
         for i in range(int(delay)):
@@ -261,31 +331,36 @@ def wait_with_random_delay(min_seconds=2.0, max_seconds=5.0):
         time.sleep(delay - int(delay))  # Handle fractional part
     else:
         time.sleep(delay)
+    deadline.check()
 
-def find_element_safely(driver, selectors, timeout=10, element_type="element"):
+def find_element_safely(driver, selectors, timeout=10, element_type="element", deadline=None):
     """Safely find an element using multiple selectors with enhanced logging"""
     logging.info(f"Looking for {element_type}...")
+    deadline = deadline or Deadline()
     
     for i, selector in enumerate(selectors):
         try:
             logging.debug(f"Trying selector {i+1}/{len(selectors)}: {selector}")
+            selector_timeout = deadline.clamp(timeout, f"looking for {element_type}")
             
             if selector.startswith('//'):
-                element = WebDriverWait(driver, timeout).until(
+                element = WebDriverWait(driver, selector_timeout).until(
                     EC.presence_of_element_located((By.XPATH, selector))
                 )
             else:
-                element = WebDriverWait(driver, timeout).until(
+                element = WebDriverWait(driver, selector_timeout).until(
                     EC.presence_of_element_located((By.CSS_SELECTOR, selector))
                 )
             
             if element and element.is_displayed():
                 # Scroll element into view
                 driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                wait_with_random_delay(0.5, 1)
+                wait_with_random_delay(0.5, 1, deadline)
                 logging.info(f"Found {element_type} with selector: {selector}")
                 return element
                 
+        except DeadlineExceeded:
+            raise
         except TimeoutException:
             logging.debug(f"Selector {i+1} timed out: {selector}")
             continue
@@ -296,10 +371,15 @@ def find_element_safely(driver, selectors, timeout=10, element_type="element"):
     logging.error(f"Could not find {element_type} with any selector")
     return None
 
-def translate_ukrainian_status(text):
+def translate_ukrainian_status(text, deadline=None):
     """Translate Ukrainian text to English using Google Translate API with fallback"""
     if not text.strip():
         return text
+
+    deadline = deadline or Deadline()
+    if deadline.expired():
+        logging.warning("No time left for translation, keeping original text")
+        return text
         
     try:
         logging.info("Translating status using Google Translate...")
@@ -312,7 +392,7 @@ def translate_ukrainian_status(text):
             'q': text
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = requests.get(url, params=params, timeout=deadline.clamp(10))
         if response.status_code == 200:
             result = response.json()
             # Google returns a nested list of translations
@@ -327,9 +407,51 @@ def translate_ukrainian_status(text):
         logging.error(f"Translation error: {str(e)}")
         return text
 
-def wait_for_cloudflare(driver, wait, max_retries=3):
-    """Handle Cloudflare protection with enhanced detection and retries"""
+# Cheap in-page probe for the Cloudflare interstitial. Returns a handful of
+# fields instead of serializing the whole page_source on every poll.
+CLOUDFLARE_PROBE_SCRIPT = """
+var title = document.title || '';
+var challenge = !!document.querySelector(
+    '#challenge-form, #challenge-stage, #challenge-running, #cf-challenge-stage, ' +
+    '#cf-please-wait, .cf-browser-verification, .cf-checking-browser, #turnstile-wrapper'
+);
+return {title: title, challenge: challenge, ready: document.readyState};
+"""
+
+CLOUDFLARE_TITLE_INDICATORS = [
+    "just a moment",
+    "please wait",
+    "checking your browser",
+    "attention required",
+    "cloudflare",
+]
+
+
+def probe_cloudflare(driver):
+    """Return True while the Cloudflare challenge page is still being shown"""
+    state = driver.execute_script(CLOUDFLARE_PROBE_SCRIPT) or {}
+    title = (state.get('title') or '').lower()
+    return bool(state.get('challenge')) or any(ind in title for ind in CLOUDFLARE_TITLE_INDICATORS)
+
+
+def has_clearance_cookie(driver):
+    """Check whether Cloudflare has issued the cf_clearance cookie"""
+    try:
+        return driver.get_cookie('cf_clearance') is not None
+    except Exception:
+        return False
+
+
+def wait_for_cloudflare(driver, wait, max_retries=3, timeout=20, poll_interval=0.5, deadline=None):
+    """Handle Cloudflare protection by polling for challenge completion.
+
+    Each attempt polls a small script (title plus challenge nodes) every
+    poll_interval seconds and returns as soon as the challenge clears. The page
+    is only refreshed if the challenge is still shown after timeout seconds, or
+    if cf_clearance was issued but the page did not move on by itself.
+    """
     logging.info("Checking for Cloudflare protection...")
+    deadline = deadline or Deadline()
     
     for attempt in range(max_retries):
         try:
@@ -337,41 +459,45 @@ def wait_for_cloudflare(driver, wait, max_retries=3):
             if not driver.current_url:
                 logging.warning("Driver session lost, cannot check Cloudflare")
                 return False
-                
-            page_source = driver.page_source
-            page_title = driver.title.lower()
             
-            # Enhanced Cloudflare detection
-            cloudflare_indicators = [
-                "Just a moment",
-                "Please Wait", 
-                "Checking your browser",
-                "DDoS protection by Cloudflare",
-                "Cloudflare Ray ID",
-                "cf-browser-verification",
-                "Challenge running"
-            ]
+            if not probe_cloudflare(driver):
+                logging.info("No Cloudflare protection detected")
+                return True
+            
+            logging.warning(f"Cloudflare protection detected, attempt {attempt + 1}/{max_retries}")
+            print(f"Waiting for Cloudflare protection to pass...")
             
-            is_cloudflare = any(indicator in page_source for indicator in cloudflare_indicators)
-            is_cloudflare = is_cloudflare or "cloudflare" in page_title
+            had_clearance = has_clearance_cookie(driver)
+            started = time.monotonic()
+            clearance_seen_at = None
+            last_report = 0
             
-            if is_cloudflare:
-                logging.warning(f"Cloudflare protection detected, attempt {attempt + 1}/{max_retries}")
-                print(f"Waiting for Cloudflare protection to pass...")
+            while time.monotonic() - started < timeout:
+                deadline.sleep(poll_interval)
+                elapsed = time.monotonic() - started
                 
-                # Longer wait for Cloudflare with progress indicator
-                for i in range(20):
-                    time.sleep(1)
-                    if i % 5 == 0:
-                        print(f"Waiting... {20-i} seconds remaining")
+                if not probe_cloudflare(driver):
+                    logging.info(f"Cloudflare challenge cleared after {elapsed:.1f}s")
+                    return True
                 
-                logging.info("Refreshing page after Cloudflare wait")
-                driver.refresh()
-                wait_with_random_delay(3, 5)
-            else:
-                logging.info("No Cloudflare protection detected")
-                return True
+                if clearance_seen_at is None and not had_clearance and has_clearance_cookie(driver):
+                    logging.info(f"cf_clearance cookie issued after {elapsed:.1f}s")
+                    clearance_seen_at = elapsed
                 
+                # Cookie is there but the interstitial did not reload itself
+                if clearance_seen_at is not None and elapsed - clearance_seen_at >= 3:
+                    break
+                
+                if int(elapsed) // 5 > last_report:
+                    last_report = int(elapsed) // 5
+                    print(f"Waiting... {int(timeout - elapsed)} seconds remaining")
+            
+            logging.info("Refreshing page after Cloudflare wait")
+            driver.refresh()
+            wait_with_random_delay(1, 2, deadline)
+                
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logging.error(f"Error during Cloudflare check (attempt {attempt + 1}): {str(e)}")
             if "no such window" in str(e).lower() or "target window already closed" in str(e).lower():
@@ -380,15 +506,117 @@ def wait_for_cloudflare(driver, wait, max_retries=3):
             if attempt == max_retries - 1:
                 logging.error("Max retries reached for Cloudflare check")
                 return False
-            wait_with_random_delay(2, 4)
+            wait_with_random_delay(2, 4, deadline)
+    
+    # The last refresh may have been enough
+    try:
+        if not probe_cloudflare(driver):
+            logging.info("Cloudflare challenge cleared after final refresh")
+            return True
+    except Exception:
+        pass
     
     logging.warning("Could not verify Cloudflare status after max retries")
     return False
 
-def fetch_status_via_ajax(driver, session_id: str) -> str | None:
+# lxml is several times faster than the pure-Python html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+STATUS_CONTAINER_ID = 'statusResultId'
+STATUS_STRAINER = SoupStrainer(id=STATUS_CONTAINER_ID)
+
+
+def status_container(html, parser=None):
+    """Parse only the #statusResultId subtree of html; None if it is not there"""
+    if STATUS_CONTAINER_ID not in html:
+        return None
+    soup = BeautifulSoup(html, parser or HTML_PARSER, parse_only=STATUS_STRAINER)
+    return soup.find(id=STATUS_CONTAINER_ID)
+
+
+def parse_status_html(html: str, parser=None) -> str | None:
+    """Extract the status table (or failing that, its text) from an HTML fragment"""
+    try:
+        # Prefer statusResultId content; parse everything only for bare fragments
+        container = status_container(html, parser) or BeautifulSoup(html, parser or HTML_PARSER)
+        table = container.find('table')
+        if table:
+            rows = table.find_all('tr')
+            formatted = []
+            for row in rows:
+                cols = [col.get_text(strip=True) for col in row.find_all(['td', 'th'])]
+                if len(cols) >= 2 and any(cols):
+                    formatted.append('\t'.join(cols[:2]))
+            if formatted:
+                return 'Status\tDate\n' + '\n'.join(formatted)
+            # Fallback to raw table text
+            text = table.get_text('\n', strip=True)
+            if text:
+                return text
+        # Fallback: any substantial text
+        text = container.get_text('\n', strip=True)
+        if text and len(text) > 80:
+            return text
+    except Exception as parse_err:
+        logging.debug(f"Status HTML parse error: {parse_err}")
+    return None
+
+STATUS_CONTAINER_SELECTOR = '#statusResultId'
+
+# Fallback for drivers without CDP: one script round trip for the same subtree
+STATUS_SNAPSHOT_SCRIPT = """
+var el = document.querySelector(arguments[0]);
+return el ? el.outerHTML : document.documentElement.outerHTML;
+"""
+
+
+def status_snapshot(driver):
+    """outerHTML of the #statusResultId container, fetched once per page load.
+
+    Only the result subtree is pulled over CDP (DOM.querySelector plus
+    DOM.getOuterHTML) instead of the whole page_source; the full document is
+    returned only when the container is missing. The snapshot is memoized on
+    the driver per navigation, so the parser, the keyword search and the
+    debug dump of one check share a single transfer.
+    """
+    try:
+        root = driver.execute_cdp_cmd('DOM.getDocument', {'depth': 0})['root']
+        key = (root.get('backendNodeId'), root.get('documentURL'))
+        cached = getattr(driver, '_status_snapshot', None)
+        if cached and cached[0] == key:
+            return cached[1]
+        node_id = driver.execute_cdp_cmd('DOM.querySelector', {
+            'nodeId': root['nodeId'], 'selector': STATUS_CONTAINER_SELECTOR
+        }).get('nodeId')
+        html = driver.execute_cdp_cmd('DOM.getOuterHTML', {'nodeId': node_id or root['nodeId']})['outerHTML']
+    except Exception as e:
+        logging.debug(f"CDP snapshot unavailable ({e}), using a script")
+        key = None
+        html = driver.execute_script(STATUS_SNAPSHOT_SCRIPT, STATUS_CONTAINER_SELECTOR) or ""
+    driver._status_snapshot = (key, html)
+    return html
+
+
+def save_debug_html(html, prefix, passport_code=None):
+    """Queue html for the artifact store as a <prefix> capture and return its digest, or None.
+
+    Identical pages are stored once; the write happens off this thread.
+    """
+    try:
+        return artifact_store.default_store().save(html, prefix, passport_code)
+    except Exception as e:
+        logging.debug(f"Could not save {prefix} page: {e}")
+        return None
+
+def fetch_status_via_ajax(driver, session_id: str, deadline=None) -> str | None:
     """Call the site's AJAX endpoint directly using the browser's cookies.
     Returns extracted text if successful, else None.
     """
+    deadline = deadline or Deadline()
     try:
         base_url = "https://passport.mfa.gov.ua"
         endpoint = f"{base_url}/Home/CurrentSessionStatus?sessionId={session_id}"
@@ -397,7 +625,9 @@ def fetch_status_via_ajax(driver, session_id: str) -> str | None:
         try:
             if not driver.current_url or base_url not in driver.current_url:
                 driver.get(base_url)
-                wait_with_random_delay(2, 4)
+                wait_with_random_delay(2, 4, deadline)
+        except DeadlineExceeded:
+            raise
         except Exception:
             pass
 
@@ -430,7 +660,7 @@ def fetch_status_via_ajax(driver, session_id: str) -> str | None:
         if cookies:
             sess.cookies.update(cookies)
 
-        resp = sess.get(endpoint, timeout=20, allow_redirects=True)
+        resp = sess.get(endpoint, timeout=deadline.clamp(20), allow_redirects=True)
         if resp.status_code != 200:
             logging.warning(f"AJAX endpoint returned HTTP {resp.status_code}")
             return None
@@ -438,43 +668,16 @@ def fetch_status_via_ajax(driver, session_id: str) -> str | None:
         html = resp.text or ""
 
         # Persist for debugging
-        try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            logs_dir = os.path.join(script_dir, 'logs')
-            os.makedirs(logs_dir, exist_ok=True)
-            debug_filename = os.path.join(logs_dir, f"ajax_status_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-            with open(debug_filename, 'w', encoding='utf-8') as f:
-                f.write(html)
-            logging.info(f"Saved AJAX response to: {debug_filename}")
-        except Exception:
-            pass
-
-        # Parse and extract meaningful table/text
-        try:
-            soup = BeautifulSoup(html, 'html.parser')
-            # Prefer statusResultId content
-            container = soup.find(id='statusResultId') or soup
-            table = container.find('table') if container else None
-            if table:
-                rows = table.find_all('tr')
-                formatted = []
-                for row in rows:
-                    cols = [col.get_text(strip=True) for col in row.find_all(['td', 'th'])]
-                    if len(cols) >= 2 and any(cols):
-                        formatted.append('\t'.join(cols[:2]))
-                if formatted:
-                    return 'Status\tDate\n' + '\n'.join(formatted)
-                # Fallback to raw table text
-                text = table.get_text('\n', strip=True)
-                if text:
-                    return text
-            # Fallback: any substantial text
-            text = container.get_text('\n', strip=True) if container else soup.get_text('\n', strip=True)
-            if text and len(text) > 80:
-                return text
-        except Exception as parse_err:
-            logging.debug(f"AJAX parse error: {parse_err}")
+        digest = save_debug_html(html, 'ajax_status', session_id)
+        if digest:
+            logging.info(f"Saved AJAX response as artifact {digest[:12]}")
 
+        return parse_status_html(html)
+    except DeadlineExceeded:
+        raise
+    except requests.Timeout as e:
+        deadline.check("AJAX request")
+        logging.warning(f"AJAX fallback failed: {e}")
         return None
     except Exception as e:
         logging.warning(f"AJAX fallback failed: {e}")
@@ -544,6 +747,12 @@ def compare_with_last_log(translated_log, script_dir):
 
 def check_passport():
     """Main passport checking function with enhanced anti-detection and error handling"""
+    # Imported here: check_engine builds on this module
+    import rate_limiter
+    from check_engine import CheckEngine, ERROR, BLOCKED, TIMEOUT
+    from circuit_breaker import CircuitBreaker, CircuitOpen
+    from state_store import StateStore
+    
     # Create logs directory if it doesn't exist
     script_dir = os.path.dirname(os.path.abspath(__file__))
     logs_dir = os.path.join(script_dir, 'logs')
@@ -563,13 +772,63 @@ def check_passport():
         logging.error("❌ Failed to load initial configuration")
         return
 
-    check_count = 0
+    config = config_monitor.get_config()
+    breaker = CircuitBreaker(**config.get('circuit_breaker', {}))
+    
+    # Schedule, check count and in-flight job survive restarts
+    store = StateStore(config.get('state_db'))
+    schedule = store.resume_schedule(
+        'cli', config.get('passport_code', '1320864'), config.get('check_interval_seconds', 3600),
+        config.get('resume_spread_seconds', 60)
+    )
+    check_count = schedule['check_count']
+    if check_count:
+        logging.info(f"Resuming schedule after {check_count} earlier checks")
+    
     while True:
+        # Wait for the persisted next due time, with progress indicator
+        wait_seconds = int(schedule['next_due'] - time.time())
+        if wait_seconds > 60:
+            next_check_time = datetime.now().timestamp() + wait_seconds
+            next_check_str = datetime.fromtimestamp(next_check_time).strftime('%H:%M:%S')
+            logging.info(f"⏰ Next check at {next_check_str} (waiting {wait_seconds}s)")
+            print(f"⏰ Next check at {next_check_str}")
+            
+            # Show progress every 5 minutes for long waits
+            for i in range(0, wait_seconds, 300):  # Every 5 minutes
+                remaining = wait_seconds - i
+                if remaining > 300:
+                    time.sleep(300)
+                    remaining_mins = remaining // 60
+                    logging.info(f"⏳ {remaining_mins} minutes until next check...")
+                    print(f"⏳ {remaining_mins} minutes until next check...")
+                else:
+                    time.sleep(remaining)
+                    break
+        elif wait_seconds > 0:
+            time.sleep(wait_seconds)
+        
+        # A malformed code never reaches the browser; the config monitor picks up a fix
+        config = config_monitor.get_config()
+        code_error = validate_code(normalize_code(config.get('passport_code', '1320864')), config.get('passport_code_pattern'))
+        if code_error:
+            logging.error(f"❌ {code_error}, fix passport_code in config.json")
+            print(f"❌ {code_error} - fix passport_code in config.json")
+            time.sleep(120)
+            continue
+        
+        try:
+            probe = breaker.before_check()
+        except CircuitOpen as e:
+            time.sleep(e.retry_after)
+            continue
         check_count += 1
         
         # Get current configuration (thread-safe)
         config = config_monitor.get_config()
-        passport_code = config.get('passport_code', '1320864')
+        rate_limiter.configure(config.get('rate_limit'))
+        artifact_store.configure(config.get('artifacts'))
+        passport_code = normalize_code(config.get('passport_code', '1320864'))
         check_interval = config.get('check_interval_seconds', 3600)
 
         # Get timeout settings from config
@@ -582,216 +841,39 @@ def check_passport():
         print(f"\nStarting passport check #{check_count} at {datetime.now().strftime('%H:%M:%S')}")
         logging.info(f"Using config: passport={passport_code}, interval={check_interval}s, timeouts=({search_input_wait},{search_button_wait},{result_wait})")
         
-        driver = None
+        engine = CheckEngine(timeouts={
+            'search_input_wait': search_input_wait,
+            'search_button_wait': search_button_wait,
+            'result_wait': result_wait,
+        }, deadline_seconds=config.get('check_deadline_seconds', DEFAULT_CHECK_SECONDS), page_load=config.get('page_load'))
+        job_id = store.start_job('cli', passport_code)
+        job_status, job_error = None, None
         try:
-            driver = setup_driver(config)
-            
-            # Enhanced stealth navigation with random delays
-            url = "https://passport.mfa.gov.ua"
-            logging.info(f"Accessing URL: {url}")
             print(f"Loading website with anti-detection measures...")
             
             # Random delay before accessing site
             wait_with_random_delay(2, 5)
             
-            driver.get(url)
-
-            # Wait for the main body of the page to be loaded.
-            try:
-                WebDriverWait(driver, 30).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                logging.info("Page body loaded.")
-            except TimeoutException:
-                raise RuntimeError("Page did not load within 30 seconds.")
-            
-            # Simulate human-like behavior
-            logging.info("Simulating human behavior...")
-            print("Simulating human browsing behavior...")
-            
-            # Random mouse movements and page interactions
-            driver.execute_script("""
-                // Simulate mouse movements
-                var event = new MouseEvent('mousemove', {
-                    clientX: Math.random() * window.innerWidth,
-                    clientY: Math.random() * window.innerHeight
-                });
-                document.dispatchEvent(event);
-                
-                // Simulate scroll
-                window.scrollTo(0, Math.random() * 200);
-            """)
-            
-            # Enhanced Cloudflare handling with better error recovery
-            if not wait_for_cloudflare(driver, None):
-                raise RuntimeError("Could not bypass Cloudflare or anti-bot protection")
-
-            # Additional human simulation before form interaction - more realistic
-            logging.info("Simulating detailed human browsing behavior...")
-            print("Applying advanced stealth techniques...")
-            
-            # Simulate reading the page more thoroughly
-            wait_with_random_delay(8, 15)
-            
-            # Multiple scroll patterns like a human reading
-            driver.execute_script("""
-                // Simulate realistic human scrolling patterns
-                function humanScroll() {
-                    window.scrollTo(0, 150);
-                    setTimeout(() => window.scrollTo(0, 300), 800);
-                    setTimeout(() => window.scrollTo(0, 100), 1600);
-                    setTimeout(() => window.scrollTo(0, 0), 2400);
-                }
-                humanScroll();
-                
-                // Simulate mouse hover on different elements
-                var elements = document.querySelectorAll('input, button, a');
-                if (elements.length > 0) {
-                    var randomElement = elements[Math.floor(Math.random() * elements.length)];
-                    var event = new MouseEvent('mouseover', {bubbles: true});
-                    randomElement.dispatchEvent(event);
-                }
-            """)
-            
-            wait_with_random_delay(4, 8)
-
-            # Find search input with enhanced selectors
-            logging.info("Looking for search input...")
-            print("Finding search input...")
-            
-            input_selectors = [
-                'input[type="text"]',
-                'input[name="passport"]',
-                'input[name="number"]',
-                'input[placeholder*="passport"]',
-                'input[placeholder*="номер"]',
-                'input[class*="search"]',
-                '//input[@type="text"]',
-                '//input[contains(@class, "search")]',
-                '//input[contains(@placeholder, "passport")]',
-                '//input[not(@type="hidden")]',
-                'input'
-            ]
-            
-            search_input = find_element_safely(driver, input_selectors, search_input_wait, "search input")
-            if not search_input:
-                raise NoSuchElementException("Could not find search input")
-
-            # Enhanced human-like typing with random delays
-            logging.info(f"Typing passport code: {passport_code}")
-            print("Entering passport code with human-like typing...")
-            
-            # Focus on input like a human would
-            search_input.click()
-            wait_with_random_delay(0.5, 1.2)
-            
-            search_input.clear()
-            wait_with_random_delay(0.3, 0.8)
-            
-            # Type with human-like rhythm
-            for i, digit in enumerate(passport_code):
-                search_input.send_keys(digit)
-                # Variable typing speed - slower at start, faster as typing continues
-                if i < 3:
-                    wait_with_random_delay(0.15, 0.4)  # Slower start
-                else:
-                    wait_with_random_delay(0.08, 0.25)  # Faster typing
-
-            # Small pause before submitting (human behavior)
-            wait_with_random_delay(1, 2.5)
-
-            # Find and click search button
-            logging.info("Looking for search button...")
-            print("Finding search button...")
-            
-            button_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:not([type])',
-                '.search-button',
-                '//button[@type="submit"]',
-                '//input[@type="submit"]',
-                '//button[contains(text(), "Search")]',
-                '//button[contains(text(), "Пошук")]',
-                'button'
-            ]
-            
-            search_button = find_element_safely(driver, button_selectors, search_button_wait, "search button")
-            if not search_button:
-                raise NoSuchElementException("Could not find search button")
-
-            logging.info("Clicking search button...")
-            print("Submitting search with human-like click...")
-            
-            # Human-like click with small movement
-            driver.execute_script("arguments[0].focus();", search_button)
-            wait_with_random_delay(0.2, 0.5)
-            search_button.click()
-
-            # Wait for results with extended time for dynamic loading
-            print("Waiting for results (extended wait for dynamic content)...")
-            wait_with_random_delay(10, 18)  # Much longer wait for dynamic content
-
-            # Additional wait and page interaction to trigger any lazy loading
-            logging.info("Ensuring all dynamic content is loaded...")
-            print("Checking for dynamic content loading...")
-            
-            # Scroll to trigger any lazy loading
-            driver.execute_script("""
-                window.scrollTo(0, document.body.scrollHeight);
-                setTimeout(() => window.scrollTo(0, 0), 1000);
-            """)
-            
-            wait_with_random_delay(5, 8)
-            
-            # Check if page is still loading
-            page_state = driver.execute_script("return document.readyState")
-            logging.info(f"Page state: {page_state}")
-            
-            if page_state != "complete":
-                logging.info("Page still loading, waiting longer...")
-                wait_with_random_delay(5, 10)
-
-            # Enhanced result extraction
-            log_text = extract_passport_status(driver, result_wait)
-
-            # If the page indicates anti-bot gating, try AJAX fallback
-            unavailable_signals = [
-                'temporarily unavailable',
-                'тимчасово недоступні',
-                'тимчасово недоступна',
-                'Could not extract detailed passport status'
-            ]
-            if any(sig.lower() in (log_text or '').lower() for sig in unavailable_signals):
-                logging.info("Trying AJAX fallback via cookie-authenticated request...")
-                ajax_text = fetch_status_via_ajax(driver, passport_code)
-                if ajax_text:
-                    log_text = ajax_text
-            
-            if not log_text:
-                # Try alternative extraction method if blocked
-                logging.warning("Standard extraction failed, trying alternative methods...")
-                print("Standard method blocked, trying alternative extraction...")
-                
-                # Try direct HTML parsing
-                page_source = driver.page_source
-                if "passport" in page_source.lower() or "паспорт" in page_source.lower():
-                    # Save full page source for manual review
-                    debug_filename = os.path.join(logs_dir, f"debug_page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-                    with open(debug_filename, 'w', encoding='utf-8') as f:
-                        f.write(page_source)
-                    logging.info(f"Saved debug page source to: {debug_filename}")
-                    print(f"Saved page source for analysis: {debug_filename}")
-                    
-                    log_text = "Website access successful but result extraction was blocked by anti-bot protection. Manual review required."
-                else:
-                    raise Exception("Could not extract passport status - possible anti-bot blocking")
+            result = engine.check(passport_code)
+            breaker.record(result, probe)
+            job_status = result.status
+            if result.success:
+                store.save_result(result)
+            if result.status in (ERROR, TIMEOUT):
+                raise RuntimeError(result.error)
+            log_text = result.text
 
             # Translate and process results
             translated_log = translate_ukrainian_status(log_text)
             logging.info(f"Status extracted successfully: {len(translated_log)} characters")
             print(f"\nPassport Status (English):\n{translated_log}\n")
             
+            if result.status == BLOCKED:
+                print("Anti-bot protection detected. Consider:")
+                print("   • Using a VPN or different IP address")
+                print("   • Increasing check intervals (reduce frequency)")
+                print("   • Manual verification might be required")
+            
             # Compare with last log to check for changes
             has_changed = compare_with_last_log(translated_log, script_dir)
             
@@ -815,6 +897,7 @@ def check_passport():
             print(f"Check #{check_count} completed successfully")
                 
         except Exception as e:
+            job_error = str(e)
             logging.error(f"Error in check #{check_count}: {str(e)}")
             print(f"Error in check #{check_count}: {str(e)}")
             
@@ -826,41 +909,30 @@ def check_passport():
                 print("   • Manual verification might be required")
             
         finally:
-            # Enhanced cleanup with error suppression
-            if driver:
-                try:
-                    driver.quit()
-                    logging.debug("Driver cleanup completed")
-                except Exception as cleanup_error:
-                    logging.debug(f"Driver cleanup error (suppressed): {cleanup_error}")
-            
-        # Wait before next check with progress indicator
-        if check_interval > 60:
-            next_check_time = datetime.now().timestamp() + check_interval
-            next_check_str = datetime.fromtimestamp(next_check_time).strftime('%H:%M:%S')
-            logging.info(f"⏰ Next check at {next_check_str} (waiting {check_interval}s)")
-            print(f"⏰ Next check at {next_check_str}")
+            if job_status is None:
+                # No result reached the breaker; don't leave the probe slot taken
+                breaker.cancel(probe)
+            engine.close()
+            store.finish_job(job_id, job_status, job_error)
             
-            # Show progress every 5 minutes for long waits
-            for i in range(0, check_interval, 300):  # Every 5 minutes
-                remaining = check_interval - i
-                if remaining > 300:
-                    time.sleep(300)
-                    remaining_mins = remaining // 60
-                    logging.info(f"⏳ {remaining_mins} minutes until next check...")
-                    print(f"⏳ {remaining_mins} minutes until next check...")
-                else:
-                    time.sleep(remaining)
-                    break
-        else:
-            time.sleep(check_interval)
+        # Back off beyond the normal interval while the site keeps blocking us
+        next_wait = check_interval
+        backoff = int(breaker.retry_after())
+        if backoff > check_interval:
+            logging.warning(f"🔌 Site is blocking checks, backing off for {backoff}s")
+            print(f"🔌 Site is blocking checks, backing off for {backoff // 60} minutes")
+            next_wait = backoff
+        
+        # Persist the next due time so a restart picks up from here
+        schedule = store.schedule_next('cli', time.time() + next_wait, passport_code, check_interval)
 
-def extract_passport_status(driver, result_wait):
+def extract_passport_status(driver, result_wait, deadline=None, passport_code=None):
     """Extract passport status from page with enhanced table detection"""
     logging.info("📄 Extracting passport status...")
+    deadline = deadline or Deadline()
     
     # Wait longer for dynamic content to load
-    wait_with_random_delay(3, 6)
+    wait_with_random_delay(3, 6, deadline)
     
     # Method 1: Try to find status table specifically
     try:
@@ -926,6 +998,8 @@ def extract_passport_status(driver, result_wait):
     except Exception as e:
         logging.debug(f"Table extraction method failed: {e}")
 
+    deadline.check("status extraction")
+
     # Method 2: Try to find result container and look for any structured data
     result_selectors = [
         '#statusResultId', '.result', '.log', '.alert', '.status', 
@@ -959,6 +1033,8 @@ def extract_passport_status(driver, result_wait):
     except Exception as e:
         logging.debug(f"Result container extraction failed: {e}")
 
+    deadline.check("status extraction")
+
     # Method 3: Enhanced iframe detection
     try:
         logging.debug("Trying enhanced iframe extraction...")
@@ -1007,29 +1083,20 @@ def extract_passport_status(driver, result_wait):
     except Exception as e:
         logging.debug(f"Iframe extraction failed: {e}")
 
-    # Method 4: Full page source analysis as last resort
+    deadline.check("status extraction")
+
+    # Method 4: Result container snapshot analysis as last resort
     try:
-        logging.debug("Analyzing full page source...")
-        page_source = driver.page_source
+        logging.debug("Analyzing result container snapshot...")
+        page_source = status_snapshot(driver)
         
-        # Save full page for debugging
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        logs_dir = os.path.join(script_dir, 'logs')
-        debug_filename = os.path.join(logs_dir, f"debug_page_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-        
-        try:
-            with open(debug_filename, 'w', encoding='utf-8') as f:
-                f.write(page_source)
-            logging.info(f"💾 Saved full page source for analysis: {debug_filename}")
-        except Exception:
-            pass
+        # Save the snapshot for debugging
+        digest = save_debug_html(page_source, 'debug_page', passport_code)
+        if digest:
+            logging.info(f"💾 Saved result snapshot for analysis as artifact {digest[:12]}")
             
-        # Use BeautifulSoup for detailed analysis
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(page_source, 'html.parser')
-        
-        # Look for status table in HTML
-        status_div = soup.find('div', id='statusResultId')
+        # Parse only the status container for detailed analysis
+        status_div = status_container(page_source)
         if status_div:
             table = status_div.find('table')
             if table and hasattr(table, 'find_all'):
@@ -1058,7 +1125,7 @@ def extract_passport_status(driver, result_wait):
                     context = page_source[context_start:context_end]
                     
                     # Clean up HTML and extract text
-                    context_soup = BeautifulSoup(context, 'html.parser')
+                    context_soup = BeautifulSoup(context, HTML_PARSER)
                     clean_text = context_soup.get_text(separator='\n', strip=True)
                     
                     if len(clean_text) > 100:
@@ -1074,7 +1141,12 @@ def extract_passport_status(driver, result_wait):
     return "Could not extract detailed passport status. The website may be using advanced anti-bot protection or the page structure has changed."
 
 def main():
+    # Only the CLI owns the process's logging; importing this module must not touch it
+    setup_logging()
     check_passport()
 
 if __name__ == "__main__":
+    # Let check_engine's "import passport_check" reuse this module instead of loading it twice
+    import sys
+    sys.modules.setdefault('passport_check', sys.modules[__name__])
     main()
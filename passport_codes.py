@@ -0,0 +1,23 @@
+"""
+Passport code validation shared by the API and CLI
+A malformed code is rejected before it reaches the queue or a browser.
+"""
+import re
+
+# Application numbers are digits only; "passport_code_pattern" in config.json overrides this
+DEFAULT_PATTERN = r'\d{5,16}'
+
+
+def normalize_code(passport_code):
+    """The code as a trimmed string ('' for None)"""
+    return '' if passport_code is None else str(passport_code).strip()
+
+
+def validate_code(passport_code, pattern=None):
+    """Return why passport_code cannot be checked, or None if it looks valid"""
+    if not passport_code:
+        return "Empty passport code"
+    if not re.fullmatch(pattern or DEFAULT_PATTERN, passport_code):
+        shown = passport_code if len(passport_code) <= 32 else passport_code[:32] + '...'
+        return f"Invalid passport code format: {shown!r}"
+    return None
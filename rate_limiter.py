@@ -0,0 +1,201 @@
+"""
+Token-bucket rate limiting for requests to passport.mfa.gov.ua
+Every check acquires a token before touching the site. The "memory" backend
+paces the checks of one process; the "sqlite" backend keeps the bucket in a
+database file so the CLI, GUI and API worker processes share one budget.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from deadline import Deadline, DeadlineExceeded
+
+DEFAULT_SETTINGS = {
+    "backend": "sqlite",
+    "requests_per_minute": 6,
+    "burst": 2,
+    "path": os.path.join(os.path.expanduser('~'), '.passport_checker', 'rate_limit.db'),
+}
+
+
+def reserve(tokens, updated, now, rate, burst):
+    """Refill the bucket up to now and take one token.
+
+    Returns (tokens, wait): tokens may go negative, meaning the caller holds a
+    reservation and must wait that many seconds before using it.
+    """
+    tokens = min(burst, tokens + (now - updated) * rate) - 1
+    return tokens, (-tokens / rate if tokens < 0 else 0.0)
+
+
+class TokenBucket:
+    """In-process token bucket; acquire() blocks until a token is available"""
+
+    def __init__(self, requests_per_minute=6, burst=2):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self, deadline):
+        with self.lock:
+            now = time.monotonic()
+            tokens, wait = reserve(self.tokens, self.updated, now, self.rate, self.burst)
+            remaining = deadline.remaining()
+            if remaining is not None and wait > remaining:
+                raise DeadlineExceeded(f"rate limit wait of {wait:.0f}s exceeds the deadline")
+            self.tokens, self.updated = tokens, now
+            return wait
+
+    def _record(self, wait):
+        with self.lock:
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def acquire(self, deadline=None):
+        """Take a token, sleeping if needed; returns the seconds spent waiting"""
+        deadline = deadline or Deadline()
+        wait = self._reserve(deadline)
+        if wait:
+            logging.info(f"⏳ Rate limit: waiting {wait:.1f}s for a request slot")
+            with self.lock:
+                self.waiting += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+        self._record(wait)
+        return wait
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backend": "memory",
+                "requestsPerMinute": round(self.rate * 60, 2),
+                "burst": self.burst,
+                "waiting": self.waiting,
+                "acquired": self.acquired,
+                "averageWait": round(self.total_wait / self.acquired, 2) if self.acquired else 0.0,
+                "maxWait": round(self.max_wait, 2),
+            }
+
+
+class SqliteTokenBucket(TokenBucket):
+    """Token bucket stored in SQLite and shared by every process using the file"""
+
+    def __init__(self, path, requests_per_minute=6, burst=2, name="passport.mfa.gov.ua"):
+        super().__init__(requests_per_minute, burst)
+        self.path = path
+        self.name = name
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._connect()
+        try:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL, "
+                "acquired INTEGER DEFAULT 0, total_wait REAL DEFAULT 0, max_wait REAL DEFAULT 0)"
+            )
+            db.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, float(burst), time.time())
+            )
+        finally:
+            db.close()
+
+    def _connect(self):
+        # Connections are cheap and per call, so threads and processes never share one
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _reserve(self, deadline):
+        db = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock, serializing reservations across processes
+            db.execute("BEGIN IMMEDIATE")
+            tokens, updated = db.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens, wait = reserve(tokens, min(updated, now), now, self.rate, self.burst)
+            remaining = deadline.remaining()
+            if remaining is not None and wait > remaining:
+                db.execute("ROLLBACK")
+                raise DeadlineExceeded(f"rate limit wait of {wait:.0f}s exceeds the deadline")
+            db.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+            db.execute("COMMIT")
+            return wait
+        finally:
+            db.close()
+
+    def _record(self, wait):
+        super()._record(wait)
+        db = self._connect()
+        try:
+            db.execute(
+                "UPDATE buckets SET acquired = acquired + 1, total_wait = total_wait + ?, "
+                "max_wait = MAX(max_wait, ?) WHERE name = ?", (wait, wait, self.name)
+            )
+        finally:
+            db.close()
+
+    def stats(self):
+        stats = super().stats()
+        db = self._connect()
+        try:
+            acquired, total_wait, max_wait = db.execute(
+                "SELECT acquired, total_wait, max_wait FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+        finally:
+            db.close()
+        stats.update({
+            "backend": "sqlite",
+            "acquired": acquired,
+            "averageWait": round(total_wait / acquired, 2) if acquired else 0.0,
+            "maxWait": round(max_wait, 2),
+        })
+        return stats
+
+
+_limiter = None
+_limiter_settings = None
+_limiter_lock = threading.Lock()
+
+
+def create_limiter(settings=None):
+    """Build a limiter from the rate_limit section of config.json"""
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    if settings["backend"] == "sqlite":
+        try:
+            return SqliteTokenBucket(settings["path"], settings["requests_per_minute"], settings["burst"])
+        except sqlite3.Error as e:
+            logging.warning(f"Shared rate limit unavailable ({e}), limiting this process only")
+    return TokenBucket(settings["requests_per_minute"], settings["burst"])
+
+
+def configure(settings=None):
+    """Set the limiter every CheckEngine in this process acquires from.
+
+    Calling it again with the same settings keeps the current bucket.
+    """
+    global _limiter, _limiter_settings
+    with _limiter_lock:
+        if _limiter is None or settings != _limiter_settings:
+            _limiter = create_limiter(settings)
+            _limiter_settings = settings
+        return _limiter
+
+
+def default_limiter():
+    """The process-wide limiter, created with default settings if not configured"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = create_limiter()
+        return _limiter
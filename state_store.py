@@ -0,0 +1,314 @@
+"""
+SQLite-backed state shared by the API, CLI and GUI
+Keeps what has to survive a restart (webhook subscriptions, monitoring
+schedules and their in-flight jobs, and the latest known status of every
+checked code) in one small database file
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.passport_checker', 'state.db')
+
+# Finished jobs are kept this long for inspection
+JOB_RETENTION_SECONDS = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id TEXT PRIMARY KEY,
+    passport_code TEXT NOT NULL,
+    callback_url TEXT NOT NULL,
+    secret TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    last_status TEXT,
+    last_fingerprint TEXT,
+    last_checked_at TEXT,
+    last_delivery_at TEXT,
+    last_delivery_error TEXT
+);
+CREATE INDEX IF NOT EXISTS subscriptions_code ON subscriptions (passport_code, active);
+CREATE TABLE IF NOT EXISTS latest_results (
+    passport_code TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    text TEXT,
+    strategy TEXT,
+    checked_at TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    fingerprint TEXT,
+    changed_at REAL
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    passport_code TEXT NOT NULL,
+    status TEXT NOT NULL,
+    text TEXT,
+    strategy TEXT,
+    checked_at TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    changed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS history_code_time ON history (passport_code, stored_at, id);
+CREATE TABLE IF NOT EXISTS schedules (
+    name TEXT PRIMARY KEY,
+    passport_code TEXT NOT NULL,
+    interval_seconds INTEGER NOT NULL,
+    next_due REAL NOT NULL,
+    check_count INTEGER NOT NULL DEFAULT 0,
+    last_run_at REAL,
+    active INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    schedule TEXT,
+    passport_code TEXT NOT NULL,
+    state TEXT NOT NULL,
+    status TEXT,
+    error TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_schedule_state ON jobs (schedule, state);
+"""
+
+# Columns added after a table was first released: (table, column, definition)
+ADDED_COLUMNS = [
+    ('latest_results', 'fingerprint', 'TEXT'),
+    ('latest_results', 'changed_at', 'REAL'),
+]
+
+
+def status_rows(text):
+    """Status table rows with whitespace normalized, ignoring empty lines"""
+    return [" ".join(line.split()) for line in (text or "").splitlines() if line.strip()]
+
+
+def status_fingerprint(text):
+    """Stable hash of the structured status, so re-wrapped text is not a change"""
+    return hashlib.sha256("\n".join(status_rows(text)).encode('utf-8')).hexdigest()
+
+
+class StateStore:
+    """Thread-safe wrapper around one SQLite connection"""
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_PATH
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            for table, column, definition in ADDED_COLUMNS:
+                columns = [row['name'] for row in self.db.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            # Databases from before the history table start it from each code's latest status
+            self.db.execute(
+                "INSERT INTO history (passport_code, status, text, strategy, checked_at, stored_at, changed) "
+                "SELECT passport_code, status, text, strategy, checked_at, stored_at, 1 FROM latest_results "
+                "WHERE NOT EXISTS (SELECT 1 FROM history)"
+            )
+
+    def execute(self, sql, params=()):
+        with self.lock, self.db:
+            return self.db.execute(sql, params)
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql, params).fetchall()]
+
+    # Subscriptions
+
+    def add_subscription(self, subscription_id, passport_code, callback_url, secret):
+        self.execute(
+            "INSERT INTO subscriptions (id, passport_code, callback_url, secret, created_at) VALUES (?, ?, ?, ?, ?)",
+            (subscription_id, passport_code, callback_url, secret, datetime.now().isoformat())
+        )
+        return self.get_subscription(subscription_id)
+
+    def get_subscription(self, subscription_id):
+        rows = self.query("SELECT * FROM subscriptions WHERE id = ? AND active = 1", (subscription_id,))
+        return rows[0] if rows else None
+
+    def remove_subscription(self, subscription_id):
+        return self.execute(
+            "UPDATE subscriptions SET active = 0 WHERE id = ? AND active = 1", (subscription_id,)
+        ).rowcount > 0
+
+    def subscriptions_for(self, passport_code):
+        return self.query(
+            "SELECT * FROM subscriptions WHERE passport_code = ? AND active = 1", (passport_code,)
+        )
+
+    def due_subscription_codes(self, older_than):
+        """Codes with at least one active subscription not checked since older_than"""
+        rows = self.query(
+            "SELECT DISTINCT passport_code FROM subscriptions WHERE active = 1 "
+            "AND (last_checked_at IS NULL OR last_checked_at < ?)", (older_than,)
+        )
+        return [row['passport_code'] for row in rows]
+
+    def update_subscription(self, subscription_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self.execute(f"UPDATE subscriptions SET {columns} WHERE id = ?", (*fields.values(), subscription_id))
+
+    # Latest results
+
+    def save_result(self, result):
+        """Remember a successful CheckResult as the code's latest known status and in its history.
+
+        changed_at only moves when the status or its structured rows differ
+        from what was stored before.
+        """
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO latest_results (passport_code, status, text, strategy, checked_at, stored_at, "
+                "fingerprint, changed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(passport_code) DO UPDATE SET status = excluded.status, text = excluded.text, "
+                "strategy = excluded.strategy, checked_at = excluded.checked_at, stored_at = excluded.stored_at, "
+                "fingerprint = excluded.fingerprint, changed_at = CASE "
+                "WHEN latest_results.status = excluded.status AND latest_results.fingerprint = excluded.fingerprint "
+                "THEN latest_results.changed_at ELSE excluded.changed_at END",
+                (result.passport_code, result.status, result.text, result.strategy, result.checked_at, now,
+                 status_fingerprint(result.text), now)
+            )
+            changed_at = self.db.execute(
+                "SELECT changed_at FROM latest_results WHERE passport_code = ?", (result.passport_code,)
+            ).fetchone()['changed_at']
+            self.db.execute(
+                "INSERT INTO history (passport_code, status, text, strategy, checked_at, stored_at, changed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (result.passport_code, result.status, result.text, result.strategy, result.checked_at, now,
+                 int(changed_at == now))
+            )
+
+    def history(self, passport_code, start=None, end=None, before=None, limit=50):
+        """One page of a code's stored results, newest first.
+
+        start/end bound stored_at (epoch seconds, end exclusive); before is
+        the (stored_at, id) key of the last row of the previous page. Every
+        filter is a range on the (passport_code, stored_at, id) index, so a
+        page costs the same however long the history is. Returns the rows
+        and the key to pass as before for the next page, or None.
+        """
+        conditions = ["passport_code = ?"]
+        params = [passport_code]
+        if start is not None:
+            conditions.append("stored_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("stored_at < ?")
+            params.append(end)
+        if before is not None:
+            conditions.append("(stored_at, id) < (?, ?)")
+            params.extend(before)
+        rows = self.query(
+            f"SELECT * FROM history WHERE {' AND '.join(conditions)} "
+            "ORDER BY stored_at DESC, id DESC LIMIT ?", (*params, limit + 1)
+        )
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1]['stored_at'], rows[-1]['id'])
+
+    def latest_result(self, passport_code):
+        """Latest stored status for a code with its age in seconds, or None"""
+        rows = self.query("SELECT * FROM latest_results WHERE passport_code = ?", (passport_code,))
+        return self._aged(rows[0], time.time()) if rows else None
+
+    def latest_results(self, passport_codes):
+        """Latest stored statuses of many codes in one query, as {code: row with age}.
+
+        The codes go in as a single JSON parameter, so thousands of them
+        don't run into SQLite's bound-variable limit. Unknown codes are
+        left out.
+        """
+        rows = self.query(
+            "SELECT * FROM latest_results WHERE passport_code IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(passport_codes)),)
+        )
+        now = time.time()
+        return {row['passport_code']: self._aged(row, now) for row in rows}
+
+    @staticmethod
+    def _aged(row, now):
+        row['age'] = max(0.0, now - row['stored_at'])
+        row['changed_at'] = row['changed_at'] or row['stored_at']
+        return row
+
+    # Schedules and jobs
+
+    def get_schedule(self, name):
+        rows = self.query("SELECT * FROM schedules WHERE name = ?", (name,))
+        return rows[0] if rows else None
+
+    def resume_schedule(self, name, passport_code, interval, spread=60):
+        """Load or create a monitoring schedule after a (re)start.
+
+        A job left running by a crash is marked interrupted and re-run. An
+        overdue schedule is not fired immediately but at a random point in the
+        next `spread` seconds, so restarting never bursts checks at the site.
+        """
+        now = time.time()
+        interrupted = self.execute(
+            "UPDATE jobs SET state = 'interrupted', finished_at = ? WHERE schedule = ? AND state = 'running'",
+            (now, name)
+        ).rowcount
+        self.execute("DELETE FROM jobs WHERE finished_at < ?", (now - JOB_RETENTION_SECONDS,))
+
+        schedule = self.get_schedule(name)
+        if schedule is None:
+            next_due = now
+        elif schedule['passport_code'] != passport_code or interrupted:
+            next_due = now + random.uniform(0, spread)
+        else:
+            # Honor a shortened interval, then spread out anything overdue
+            next_due = min(schedule['next_due'], (schedule['last_run_at'] or now) + interval)
+            if next_due < now:
+                next_due = now + random.uniform(0, spread)
+
+        self.execute(
+            "INSERT INTO schedules (name, passport_code, interval_seconds, next_due) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET passport_code = excluded.passport_code, "
+            "interval_seconds = excluded.interval_seconds, next_due = excluded.next_due, active = 1",
+            (name, passport_code, interval, next_due)
+        )
+        return self.get_schedule(name)
+
+    def schedule_next(self, name, next_due, passport_code=None, interval=None):
+        """Record a finished run and when the next one is due"""
+        self.execute(
+            "UPDATE schedules SET next_due = ?, last_run_at = ?, check_count = check_count + 1, "
+            "passport_code = COALESCE(?, passport_code), interval_seconds = COALESCE(?, interval_seconds) "
+            "WHERE name = ?",
+            (next_due, time.time(), passport_code, interval, name)
+        )
+        return self.get_schedule(name)
+
+    def set_schedule_active(self, name, active):
+        self.execute("UPDATE schedules SET active = ? WHERE name = ?", (1 if active else 0, name))
+
+    def start_job(self, schedule, passport_code):
+        return self.execute(
+            "INSERT INTO jobs (schedule, passport_code, state, started_at) VALUES (?, ?, 'running', ?)",
+            (schedule, passport_code, time.time())
+        ).lastrowid
+
+    def finish_job(self, job_id, status=None, error=None):
+        self.execute(
+            "UPDATE jobs SET state = ?, status = ?, error = ?, finished_at = ? WHERE id = ?",
+            ('failed' if error else 'done', status, error, time.time(), job_id)
+        )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,160 @@
+"""
+Stale-while-revalidate cache of passport statuses for the API
+A request is answered from the latest stored status of its code: as fresh
+within the TTL, and for a while after that as stale while a background check
+refreshes it. Codes that are requested often are refreshed shortly before
+they expire, so interactive lookups rarely wait for a browser.
+"""
+import time
+import logging
+import threading
+from collections import deque
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+class StatusCache:
+    """Answers requests from the state store's latest results and keeps hot codes warm.
+
+    refresh(passport_code) runs a real check; it is expected to save a
+    successful result to the store, which is what the cache reads.
+    """
+
+    def __init__(self, store, refresh, ttl=600, stale_ttl=3600, refresh_ahead=60,
+                 hot_requests=3, hot_window=3600, poll_interval=15, retry_seconds=300):
+        self.store = store
+        self.refresh = refresh
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_ahead = refresh_ahead
+        self.hot_requests = hot_requests
+        self.hot_window = hot_window
+        self.poll_interval = poll_interval
+        self.retry_seconds = retry_seconds
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.refreshing = set()
+        self.failed_at = {}
+        self.hits = {FRESH: 0, STALE: 0}
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def lookup(self, passport_code):
+        """Return (stored row, FRESH or STALE), or (None, None) if a live check is needed.
+
+        A stale hit starts a background refresh. Not-found results are left
+        to the negative cache and its own TTL.
+        """
+        self._note_request(passport_code)
+        if self.ttl <= 0:
+            return None, None
+        cached = self.store.latest_result(passport_code)
+        if cached and cached['status'] != 'INVALID':
+            if cached['age'] < self.ttl:
+                state = FRESH
+            elif cached['age'] < self.ttl + self.stale_ttl:
+                state = STALE
+                self.refresh_async(passport_code)
+            else:
+                state = None
+            if state:
+                with self.lock:
+                    self.hits[state] += 1
+                return cached, state
+        with self.lock:
+            self.misses += 1
+        return None, None
+
+    def _note_request(self, passport_code):
+        with self.lock:
+            times = self.requests.get(passport_code)
+            if times is None:
+                times = self.requests[passport_code] = deque(maxlen=self.hot_requests)
+            times.append(time.monotonic())
+
+    def hot_codes(self):
+        """Codes requested at least hot_requests times within hot_window"""
+        cutoff = time.monotonic() - self.hot_window
+        with self.lock:
+            for passport_code in [code for code, times in self.requests.items() if times[-1] < cutoff]:
+                del self.requests[passport_code]
+                self.failed_at.pop(passport_code, None)
+            return [
+                code for code, times in self.requests.items()
+                if len(times) >= self.hot_requests and times[0] >= cutoff
+            ]
+
+    def refresh_async(self, passport_code):
+        """Refresh a code in the background unless one is running or recently failed"""
+        with self.lock:
+            if passport_code in self.refreshing:
+                return False
+            if time.monotonic() - self.failed_at.get(passport_code, float('-inf')) < self.retry_seconds:
+                return False
+            self.refreshing.add(passport_code)
+        threading.Thread(
+            target=self._refresh, args=(passport_code,), name=f'refresh-{passport_code}', daemon=True
+        ).start()
+        return True
+
+    def _refresh(self, passport_code):
+        try:
+            result = self.refresh(passport_code)
+            ok = result.success
+            if not ok:
+                logging.info(f"Background refresh of {passport_code} failed: {result.message}")
+        except Exception as e:
+            ok = False
+            logging.error(f"❌ Background refresh of {passport_code} failed: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(passport_code)
+                self.refreshes += 1
+                if ok:
+                    self.failed_at.pop(passport_code, None)
+                else:
+                    self.refresh_failures += 1
+                    self.failed_at[passport_code] = time.monotonic()
+
+    def start(self):
+        if self.thread is None and self.ttl > 0:
+            self.thread = threading.Thread(target=self._loop, name='status-cache', daemon=True)
+            self.thread.start()
+            logging.info(f"Status cache started (TTL {self.ttl}s, refresh ahead {self.refresh_ahead}s)")
+        return self
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            try:
+                self.refresh_ahead_due()
+            except Exception as e:
+                logging.error(f"❌ Refresh-ahead run failed: {e}")
+            self.stopping.wait(self.poll_interval)
+
+    def refresh_ahead_due(self):
+        """Refresh hot codes whose stored status expires within refresh_ahead seconds"""
+        for passport_code in self.hot_codes():
+            cached = self.store.latest_result(passport_code)
+            if cached and cached['status'] != 'INVALID' and cached['age'] >= self.ttl - self.refresh_ahead:
+                if self.refresh_async(passport_code):
+                    logging.info(f"🔄 Refreshing hot code {passport_code} ahead of expiry")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "ttl": self.ttl,
+                "freshHits": self.hits[FRESH],
+                "staleHits": self.hits[STALE],
+                "misses": self.misses,
+                "refreshing": len(self.refreshing),
+                "refreshes": self.refreshes,
+                "refreshFailures": self.refresh_failures,
+                "trackedCodes": len(self.requests),
+            }
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,183 @@
+"""
+Webhook subscriptions for passport status changes
+A background scheduler checks every subscribed code once per interval and
+pushes a signed webhook to each subscriber only when the status changes, so
+clients no longer need to poll /check-passport
+"""
+import hmac
+import json
+import time
+import uuid
+import random
+import hashlib
+import logging
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+import requests
+
+from state_store import status_rows, status_fingerprint
+
+# Seconds to wait before each retry of a failed delivery
+RETRY_DELAYS = (10, 60, 300, 1800)
+
+# How far a receiver should allow the signature timestamp to drift
+SIGNATURE_TOLERANCE = 300
+
+
+def new_subscription_id():
+    return uuid.uuid4().hex
+
+
+def new_secret():
+    return secrets.token_hex(32)
+
+
+def sign_payload(secret, timestamp, body):
+    """HMAC-SHA256 over "<timestamp>.<body>", hex encoded"""
+    message = f"{timestamp}.".encode('utf-8') + body
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, timestamp, body, signature, tolerance=SIGNATURE_TOLERANCE):
+    """Check a webhook's X-Passport-Signature header; for receivers"""
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except (TypeError, ValueError):
+        return False
+    expected = "sha256=" + sign_payload(secret, timestamp, body)
+    return hmac.compare_digest(expected, signature or "")
+
+
+class WebhookSender:
+    """Delivers signed webhooks, retrying failures with exponential backoff"""
+
+    def __init__(self, store, timeout=10, retry_delays=RETRY_DELAYS):
+        self.store = store
+        self.timeout = timeout
+        self.retry_delays = retry_delays
+        self.stopping = threading.Event()
+
+    def send(self, subscription, event, payload):
+        threading.Thread(
+            target=self._deliver, args=(subscription, event, payload), daemon=True
+        ).start()
+
+    def _deliver(self, subscription, event, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        delivery_id = uuid.uuid4().hex
+        error = None
+
+        for attempt, delay in enumerate((0, *self.retry_delays), start=1):
+            if delay and self.stopping.wait(delay * random.uniform(0.8, 1.2)):
+                return
+            timestamp = str(int(time.time()))
+            headers = {
+                'Content-Type': 'application/json',
+                'User-Agent': 'ukraine-passport-checker-webhooks',
+                'X-Passport-Event': event,
+                'X-Passport-Delivery': delivery_id,
+                'X-Passport-Timestamp': timestamp,
+                'X-Passport-Signature': "sha256=" + sign_payload(subscription['secret'], timestamp, body),
+            }
+            try:
+                response = requests.post(subscription['callback_url'], data=body, headers=headers, timeout=self.timeout)
+                if 200 <= response.status_code < 300:
+                    logging.info(f"📤 Webhook {event} delivered to {subscription['callback_url']} (attempt {attempt})")
+                    self.store.update_subscription(
+                        subscription['id'], last_delivery_at=datetime.now().isoformat(), last_delivery_error=None
+                    )
+                    return
+                if response.status_code == 410:
+                    logging.info(f"Webhook receiver for subscription {subscription['id']} is gone, unsubscribing")
+                    self.store.remove_subscription(subscription['id'])
+                    return
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            logging.warning(f"⚠️ Webhook delivery to {subscription['callback_url']} failed (attempt {attempt}): {error}")
+
+        logging.error(f"❌ Giving up on webhook {delivery_id} for subscription {subscription['id']}: {error}")
+        self.store.update_subscription(subscription['id'], last_delivery_error=error)
+
+    def stop(self):
+        self.stopping.set()
+
+
+class SubscriptionScheduler:
+    """Checks subscribed passport codes on a schedule and fires change webhooks.
+
+    Each code is checked once per interval no matter how many subscriptions
+    it has. The first successful check of a subscription only records a
+    baseline; later checks notify when the structured status differs.
+    """
+
+    def __init__(self, store, check, interval=1800, poll_interval=60, sender=None):
+        self.store = store
+        self.check = check
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.sender = sender or WebhookSender(store)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name='subscriptions', daemon=True)
+            self.thread.start()
+            logging.info(f"Subscription scheduler started (every {self.interval}s)")
+        return self
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            try:
+                self.run_due()
+            except Exception as e:
+                logging.error(f"❌ Subscription run failed: {e}")
+            self.stopping.wait(self.poll_interval)
+
+    def run_due(self):
+        cutoff = (datetime.now() - timedelta(seconds=self.interval)).isoformat()
+        for passport_code in self.store.due_subscription_codes(cutoff):
+            if self.stopping.is_set():
+                return
+            self.check_code(passport_code)
+
+    def check_code(self, passport_code):
+        """Check one code and notify its subscribers if the status changed"""
+        result = self.check(passport_code)
+        checked_at = datetime.now().isoformat()
+        subscriptions = self.store.subscriptions_for(passport_code)
+
+        if not result.success:
+            # Try again next interval rather than hammering a blocked site
+            logging.warning(f"Scheduled check for {passport_code} failed: {result.message}")
+            for subscription in subscriptions:
+                self.store.update_subscription(subscription['id'], last_checked_at=checked_at)
+            return
+
+        fingerprint = status_fingerprint(result.text)
+        status = result.status
+        for subscription in subscriptions:
+            changed = subscription['last_fingerprint'] not in (None, fingerprint)
+            self.store.update_subscription(
+                subscription['id'], last_status=status, last_fingerprint=fingerprint, last_checked_at=checked_at
+            )
+            if changed:
+                logging.info(f"🔔 Status of {passport_code} changed for subscription {subscription['id']}")
+                self.sender.send(subscription, 'status.changed', {
+                    'event': 'status.changed',
+                    'subscriptionId': subscription['id'],
+                    'passportCode': passport_code,
+                    'status': status,
+                    'previousStatus': subscription['last_status'],
+                    'statusText': result.text,
+                    'rows': status_rows(result.text),
+                    'checkedAt': result.checked_at,
+                })
+
+    def stop(self):
+        self.stopping.set()
+        self.sender.stop()
@@ -0,0 +1,33 @@
+"""
+Tests for status classification in check_engine
+
+Usage: python -m unittest test_check_engine
+"""
+import unittest
+
+from check_engine import classify_status, VALID, PROCESSING, INVALID, UNKNOWN, BLOCKED
+
+
+class ClassifyStatusTest(unittest.TestCase):
+
+    def test_not_found_application_is_invalid(self):
+        self.assertEqual(classify_status("Заявку не знайдено"), INVALID)
+
+    def test_not_ready_is_not_valid(self):
+        self.assertNotEqual(classify_status("Not ready"), VALID)
+
+    def test_document_ready_is_valid(self):
+        self.assertEqual(classify_status("Заявку подано\nДокумент готовий"), VALID)
+
+    def test_submitted_application_is_processing(self):
+        self.assertEqual(classify_status("Заявку подано\t01.01.2024"), PROCESSING)
+
+    def test_unavailable_is_blocked(self):
+        self.assertEqual(classify_status("Сервіси тимчасово недоступні"), BLOCKED)
+
+    def test_empty_is_unknown(self):
+        self.assertEqual(classify_status("  "), UNKNOWN)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests for the circuit breaker state transitions
+
+Usage: python -m unittest test_circuit_breaker
+"""
+import time
+import unittest
+
+from check_engine import CheckResult, VALID, BLOCKED, ERROR
+from circuit_breaker import CircuitBreaker, CircuitOpen, CLOSED, OPEN, HALF_OPEN
+
+
+def blocked():
+    return CheckResult("AA000001", BLOCKED, text="Сервіси тимчасово недоступні")
+
+
+def valid():
+    return CheckResult("AA000001", VALID, text="Документ готовий")
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=60)
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.record(blocked(), self.breaker.before_check())
+
+    def end_cooldown(self):
+        self.breaker.opened_until = time.monotonic() - 1
+
+    def test_trips_after_threshold(self):
+        for _ in range(2):
+            self.breaker.record(blocked())
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record(blocked())
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_errors_do_not_count_as_blocked(self):
+        for _ in range(5):
+            self.breaker.record(CheckResult("AA000001", ERROR, error="net::ERR_CONNECTION_RESET"))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_success_resets_failures(self):
+        self.breaker.record(blocked())
+        self.breaker.record(blocked())
+        self.breaker.record(valid())
+        self.breaker.record(blocked())
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_open_fails_fast(self):
+        self.trip()
+        with self.assertRaises(CircuitOpen) as raised:
+            self.breaker.before_check()
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(self.breaker.stats()["fastFailures"], 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.trip()
+        self.end_cooldown()
+        self.assertTrue(self.breaker.before_check())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_check()
+
+    def test_successful_probe_closes(self):
+        self.trip()
+        self.end_cooldown()
+        self.breaker.record(valid(), self.breaker.before_check())
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertFalse(self.breaker.before_check())
+
+    def test_blocked_probe_reopens_with_doubled_cooldown(self):
+        self.trip()
+        self.end_cooldown()
+        self.breaker.record(blocked(), self.breaker.before_check())
+        self.assertEqual(self.breaker.state, OPEN)
+        # Second trip: 120s with +-10% jitter
+        self.assertGreater(self.breaker.retry_after(), 100)
+
+    def test_stale_result_does_not_settle_half_open(self):
+        self.trip()
+        self.end_cooldown()
+        probe = self.breaker.before_check()
+        self.breaker.record(valid())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_check()
+        self.breaker.record(valid(), probe)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_cancelled_probe_frees_the_slot(self):
+        self.trip()
+        self.end_cooldown()
+        self.breaker.cancel(self.breaker.before_check())
+        self.assertTrue(self.breaker.before_check())
+
+
+if __name__ == '__main__':
+    unittest.main()
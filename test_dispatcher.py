@@ -0,0 +1,103 @@
+"""
+Tests for admission control in dispatcher
+
+Usage: python -m unittest test_dispatcher
+"""
+import time
+import threading
+import unittest
+
+from dispatcher import CheckDispatcher, QueueFull, QueueTimeout, INTERACTIVE, BATCH, SCHEDULED
+
+
+class CheckDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = []
+        self.threads = []
+
+    def tearDown(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def run_check(self, passport_code):
+        self.started.append(passport_code)
+        self.release.wait(5)
+        return passport_code
+
+    def submit_in_background(self, dispatcher, passport_code, lane=INTERACTIVE):
+        thread = threading.Thread(target=dispatcher.submit, args=(passport_code, lane))
+        thread.start()
+        self.threads.append(thread)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "dispatcher did not reach the expected state")
+            time.sleep(0.01)
+
+    def test_runs_check_and_returns_result(self):
+        dispatcher = CheckDispatcher(lambda passport_code: passport_code.lower(), concurrency=1)
+        self.assertEqual(dispatcher.submit("AA000001"), "aa000001")
+        self.assertEqual(dispatcher.status()["lanes"][INTERACTIVE]["admitted"], 1)
+
+    def test_full_lane_turns_request_away(self):
+        dispatcher = CheckDispatcher(self.run_check, concurrency=1, max_depth=1, max_wait=5)
+        self.submit_in_background(dispatcher, "AA000001")
+        self.wait_for(lambda: self.started)
+        self.submit_in_background(dispatcher, "AA000002")
+        self.wait_for(lambda: dispatcher.status()["depth"] == 1)
+        with self.assertRaises(QueueFull) as raised:
+            dispatcher.submit("AA000003")
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(dispatcher.status()["lanes"][INTERACTIVE]["rejected"], 1)
+
+    def test_waiting_too_long_times_out(self):
+        dispatcher = CheckDispatcher(self.run_check, concurrency=1, max_depth=5, max_wait=0.1)
+        self.submit_in_background(dispatcher, "AA000001")
+        self.wait_for(lambda: self.started)
+        with self.assertRaises(QueueTimeout):
+            dispatcher.submit("AA000002")
+        status = dispatcher.status()
+        self.assertEqual(status["depth"], 0)
+        self.assertEqual(status["lanes"][INTERACTIVE]["timedOut"], 1)
+
+    def test_interactive_goes_before_batch_and_scheduled(self):
+        dispatcher = CheckDispatcher(self.run_check, concurrency=1, max_depth=5, max_wait=5)
+        self.submit_in_background(dispatcher, "AA000001")
+        self.wait_for(lambda: self.started)
+        self.submit_in_background(dispatcher, "AA000002", SCHEDULED)
+        self.wait_for(lambda: dispatcher.status()["depth"] == 1)
+        self.submit_in_background(dispatcher, "AA000003", BATCH)
+        self.wait_for(lambda: dispatcher.status()["depth"] == 2)
+        self.submit_in_background(dispatcher, "AA000004", INTERACTIVE)
+        self.wait_for(lambda: dispatcher.status()["depth"] == 3)
+        self.release.set()
+        self.wait_for(lambda: len(self.started) == 4)
+        self.assertEqual(self.started, ["AA000001", "AA000004", "AA000003", "AA000002"])
+
+    def test_lane_limits_are_separate(self):
+        dispatcher = CheckDispatcher(
+            self.run_check, concurrency=1, max_depth=5, max_wait=5,
+            lanes={BATCH: {'max_depth': 0}}
+        )
+        with self.assertRaises(QueueFull):
+            dispatcher.submit("AA000001", BATCH)
+        self.release.set()
+        self.assertEqual(dispatcher.submit("AA000002", INTERACTIVE), "AA000002")
+
+    def test_admit_holds_a_slot_for_the_block(self):
+        dispatcher = CheckDispatcher(self.run_check, concurrency=1, max_depth=5, max_wait=0.1)
+        with dispatcher.admit("tabs batch", BATCH):
+            self.assertEqual(dispatcher.status()["active"], 1)
+            with self.assertRaises(QueueTimeout):
+                dispatcher.submit("AA000001", BATCH)
+        self.assertEqual(dispatcher.status()["active"], 0)
+        self.release.set()
+        self.assertEqual(dispatcher.submit("AA000002", BATCH), "AA000002")
+
+
+if __name__ == '__main__':
+    unittest.main()
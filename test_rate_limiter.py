@@ -0,0 +1,87 @@
+"""
+Tests for the token-bucket rate limiters
+
+Usage: python -m unittest test_rate_limiter
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from deadline import Deadline, DeadlineExceeded
+from rate_limiter import TokenBucket, SqliteTokenBucket, create_limiter, reserve
+
+# 600 requests per minute is one token every 0.1s, so waits stay short
+RATE = 600
+
+
+class ReserveTest(unittest.TestCase):
+
+    def test_takes_a_token_from_a_full_bucket(self):
+        self.assertEqual(reserve(2.0, 0.0, 0.0, 1.0, 2), (1.0, 0.0))
+
+    def test_refill_is_capped_at_burst(self):
+        self.assertEqual(reserve(0.0, 0.0, 100.0, 1.0, 2), (1.0, 0.0))
+
+    def test_empty_bucket_reserves_ahead(self):
+        tokens, wait = reserve(0.0, 0.0, 0.0, 0.5, 2)
+        self.assertEqual(tokens, -1.0)
+        self.assertEqual(wait, 2.0)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def make_limiter(self, requests_per_minute=RATE, burst=2):
+        return TokenBucket(requests_per_minute, burst)
+
+    def test_burst_is_free(self):
+        limiter = self.make_limiter()
+        self.assertEqual(limiter.acquire(), 0.0)
+        self.assertEqual(limiter.acquire(), 0.0)
+
+    def test_waits_once_burst_is_spent(self):
+        limiter = self.make_limiter()
+        limiter.acquire()
+        limiter.acquire()
+        self.assertGreater(limiter.acquire(), 0.05)
+        stats = limiter.stats()
+        self.assertEqual(stats["acquired"], 3)
+        self.assertGreater(stats["maxWait"], 0)
+
+    def test_wait_beyond_deadline_raises(self):
+        limiter = self.make_limiter(requests_per_minute=1, burst=1)
+        limiter.acquire()
+        with self.assertRaises(DeadlineExceeded):
+            limiter.acquire(Deadline(1))
+        self.assertEqual(limiter.stats()["acquired"], 1)
+
+
+class SqliteTokenBucketTest(TokenBucketTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'rate_limit.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_limiter(self, requests_per_minute=RATE, burst=2):
+        return SqliteTokenBucket(self.path, requests_per_minute, burst)
+
+    def test_processes_share_the_bucket(self):
+        first = self.make_limiter(requests_per_minute=1, burst=2)
+        second = self.make_limiter(requests_per_minute=1, burst=2)
+        first.acquire()
+        second.acquire()
+        with self.assertRaises(DeadlineExceeded):
+            first.acquire(Deadline(1))
+        self.assertEqual(second.stats()["acquired"], 2)
+
+    def test_create_limiter_picks_backend(self):
+        limiter = create_limiter({"backend": "sqlite", "path": self.path})
+        self.assertEqual(limiter.stats()["backend"], "sqlite")
+        self.assertEqual(create_limiter({"backend": "memory"}).stats()["backend"], "memory")
+
+
+if __name__ == '__main__':
+    unittest.main()
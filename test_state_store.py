@@ -0,0 +1,72 @@
+"""
+Tests for the result history in state_store
+
+Usage: python -m unittest test_state_store
+"""
+import unittest
+
+from check_engine import CheckResult, VALID, PROCESSING
+from state_store import StateStore
+
+CODE = "AA000001"
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = StateStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def add_rows(self, stored_ats, passport_code=CODE):
+        for stored_at in stored_ats:
+            self.store.execute(
+                "INSERT INTO history (passport_code, status, text, checked_at, stored_at) VALUES (?, ?, ?, ?, ?)",
+                (passport_code, PROCESSING, "Заявку подано", "2024-01-01T00:00:00", stored_at)
+            )
+
+    def pages(self, limit, **filters):
+        pages, before = [], None
+        while True:
+            rows, before = self.store.history(CODE, before=before, limit=limit, **filters)
+            pages.append([row['stored_at'] for row in rows])
+            if before is None:
+                return pages
+
+    def test_pages_are_newest_first_without_gaps(self):
+        self.add_rows([100, 200, 300, 400, 500])
+        self.assertEqual(self.pages(2), [[500, 400], [300, 200], [100]])
+
+    def test_rows_with_the_same_time_are_not_skipped(self):
+        self.add_rows([100, 200, 200, 200, 300])
+        rows = [stored_at for page in self.pages(2) for stored_at in page]
+        self.assertEqual(rows, [300, 200, 200, 200, 100])
+
+    def test_exact_page_has_no_next_key(self):
+        self.add_rows([100, 200])
+        rows, before = self.store.history(CODE, limit=2)
+        self.assertEqual(len(rows), 2)
+        self.assertIsNone(before)
+
+    def test_start_and_end_bound_stored_at(self):
+        self.add_rows([100, 200, 300, 400, 500])
+        self.assertEqual(self.pages(2, start=200, end=500), [[400, 300], [200]])
+
+    def test_other_codes_are_not_listed(self):
+        self.add_rows([100])
+        self.add_rows([200], passport_code="AA000002")
+        rows, _ = self.store.history(CODE)
+        self.assertEqual([row['stored_at'] for row in rows], [100])
+
+    def test_save_result_marks_status_changes(self):
+        self.store.save_result(CheckResult(CODE, PROCESSING, text="Заявку подано"))
+        self.store.save_result(CheckResult(CODE, PROCESSING, text="Заявку подано"))
+        self.store.save_result(CheckResult(CODE, VALID, text="Документ готовий"))
+        rows, _ = self.store.history(CODE)
+        self.assertEqual([(row['status'], row['changed']) for row in rows],
+                         [(VALID, 1), (PROCESSING, 0), (PROCESSING, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Minimal local webhook receiver for testing passport subscriptions
+Verifies the signature of each webhook and prints its payload.
+
+Usage: python webhook_receiver.py <secret> [port]
+Then subscribe with callbackUrl http://localhost:<port>/webhook
+"""
+import sys
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from subscriptions import verify_signature
+
+
+def make_handler(secret):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if not verify_signature(secret, self.headers.get('X-Passport-Timestamp'), body,
+                                    self.headers.get('X-Passport-Signature')):
+                print("❌ Rejected webhook with a bad signature")
+                self.send_response(401)
+                self.end_headers()
+                return
+
+            payload = json.loads(body)
+            print(f"🔔 {self.headers.get('X-Passport-Event')} (delivery {self.headers.get('X-Passport-Delivery')})")
+            print(json.dumps(payload, ensure_ascii=False, indent=2))
+            self.send_response(204)
+            self.end_headers()
+
+    return WebhookHandler
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-2])
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 9000
+    print(f"Listening for webhooks on http://localhost:{port}/webhook")
+    HTTPServer(('', port), make_handler(sys.argv[1])).serve_forever()
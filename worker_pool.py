@@ -0,0 +1,214 @@
+"""
+Supervised pool of browser worker processes
+Each worker process owns its own CheckEngine and Chrome. Tasks have a hard
+timeout; a worker that crashes or hangs is killed together with its browser
+and replaced, so a wedged Chrome costs one worker instead of the whole service
+"""
+import os
+import sys
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+
+from deadline import as_deadline
+
+# Extra seconds a worker gets past the check deadline to report its TIMEOUT
+# result before the supervisor kills it
+KILL_GRACE = 10
+
+# Workers start from a fresh interpreter: a fork of the threaded API server
+# would inherit held locks, open SQLite connections, the listening socket
+# and its log handlers
+MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def _worker_main(conn, engine_options):
+    """Worker process loop: run checks received over the pipe"""
+    if hasattr(os, 'setpgrp'):
+        # Own process group so the supervisor can kill Chrome along with us
+        os.setpgrp()
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - %(levelname)s - [worker {os.getpid()}] %(message)s'
+    )
+
+    import rate_limiter
+    import artifact_store
+    from check_engine import CheckEngine, BrowserStrategy, AjaxStrategy
+    rate_limiter.configure(engine_options.get('rate_limit'))
+    artifact_store.configure(engine_options.get('artifacts'))
+    engine = CheckEngine(
+        strategies=[BrowserStrategy(humanize=engine_options.get('humanize', False)), AjaxStrategy()],
+        keep_driver=True,
+        timeouts=engine_options.get('timeouts'),
+        page_load=engine_options.get('page_load')
+    )
+
+    try:
+        try:
+            engine.start()
+        except Exception as e:
+            logging.error(f"Browser warm-up failed, will retry on first check: {e}")
+
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                break
+            if task is None:
+                break
+            result = engine.check(task['passport_code'], deadline=task.get('deadline'))
+            conn.send(result.to_dict())
+    finally:
+        engine.close()
+
+
+class Worker:
+    """Handle for one worker process and its end of the pipe"""
+
+    def __init__(self, engine_options):
+        self.conn, child_conn = MP_CONTEXT.Pipe()
+        self.process = MP_CONTEXT.Process(
+            target=_worker_main, args=(child_conn, engine_options), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks_done = 0
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def kill(self):
+        """Kill the worker and any browser processes it started"""
+        pid = self.process.pid
+        try:
+            import psutil
+            parent = psutil.Process(pid)
+            for child in parent.children(recursive=True):
+                child.kill()
+        except Exception:
+            if hasattr(os, 'killpg'):
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except Exception:
+                    pass
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=30)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+
+
+class BrowserWorkerPool:
+    """Runs checks on a fixed number of supervised worker processes.
+
+    submit() blocks until a worker is free and the check completes, the task
+    timeout passes (the worker is killed and respawned) or the worker dies.
+    With a deadline, the time spent waiting for a free worker counts against
+    it and the worker is told how much is left.
+    """
+
+    def __init__(self, size=2, task_timeout=180, engine_options=None):
+        self.size = size
+        self.task_timeout = task_timeout
+        self.engine_options = engine_options or {}
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = False
+        self.stats = {'completed': 0, 'timeouts': 0, 'crashes': 0, 'respawns': 0}
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return self
+            for _ in range(self.size):
+                self.idle.put(Worker(self.engine_options))
+            self.started = True
+            logging.info(f"Started {self.size} browser worker processes")
+            return self
+
+    def _respawn(self, worker, stat, reason):
+        logging.warning(f"Browser worker {worker.process.pid} {reason}, respawning")
+        worker.kill()
+        self.stats[stat] += 1
+        self.stats['respawns'] += 1
+        return Worker(self.engine_options)
+
+    def submit(self, passport_code, timeout=None, deadline=None):
+        """Run one check on a worker and return its CheckResult"""
+        from check_engine import CheckResult, ERROR, TIMEOUT
+
+        self.start()
+        deadline = as_deadline(deadline)
+        timeout = timeout or self.task_timeout
+        started = time.monotonic()
+        try:
+            worker = self.idle.get(timeout=deadline.remaining())
+        except queue.Empty:
+            return CheckResult(
+                passport_code, TIMEOUT, error="Deadline passed while waiting for a free browser worker",
+                elapsed=round(time.monotonic() - started, 2)
+            )
+        try:
+            if not worker.is_alive():
+                worker = self._respawn(worker, 'crashes', 'died while idle')
+
+            remaining = deadline.remaining()
+            if remaining is not None:
+                timeout = min(timeout, remaining + KILL_GRACE)
+            worker.conn.send({'passport_code': passport_code, 'deadline': remaining})
+            if not worker.conn.poll(timeout):
+                worker = self._respawn(worker, 'timeouts', f'exceeded {timeout:.0f}s')
+                return CheckResult(
+                    passport_code, TIMEOUT, error=f"Check exceeded {timeout:.0f}s and was aborted",
+                    elapsed=round(time.monotonic() - started, 2)
+                )
+
+            data = worker.conn.recv()
+            worker.tasks_done += 1
+            self.stats['completed'] += 1
+            return CheckResult.from_dict(data)
+
+        except (EOFError, OSError, BrokenPipeError) as e:
+            worker = self._respawn(worker, 'crashes', 'crashed mid-check')
+            return CheckResult(
+                passport_code, ERROR, error=f"Browser worker crashed: {str(e) or 'connection lost'}",
+                elapsed=round(time.monotonic() - started, 2)
+            )
+        finally:
+            self.idle.put(worker)
+
+    def status(self):
+        return {
+            'workers': self.size,
+            'idle': self.idle.qsize(),
+            **self.stats,
+        }
+
+    def close(self):
+        with self.lock:
+            if not self.started:
+                return
+            for _ in range(self.size):
+                self.idle.get().stop()
+            self.started = False
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    pool = BrowserWorkerPool(size=1)
+    try:
+        for code in sys.argv[1:]:
+            print(pool.submit(code).to_dict())
+    finally:
+        pool.close()